@@ -1,10 +1,11 @@
 from django.contrib import admin
-from .models import Category, Tag, Thread, Reply, Resource, Course
+from .models import Category, Tag, Thread, Reply, Resource, Course, Job
 
 admin.site.register(Thread)
 admin.site.register(Reply)
 admin.site.register(Course)
 admin.site.register(Resource)
+admin.site.register(Job)
 
 
 @admin.register(Category)
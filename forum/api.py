@@ -0,0 +1,222 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .caching import get_versions
+from .models import Course, Reply, Resource, Tag, Thread
+from .pagination import CursorPaginator
+
+
+API_PAGE_SIZE = 25
+
+
+def api_login_required(view):
+    # like login_required, but a 401 instead of a redirect to the login page
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "authentication required"}, status=401)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def conditional_json(request, validators, last_modified, build):
+    """
+    Answer from `validators` (everything the payload depends on, already
+    loaded) before building the payload: a matching If-None-Match or
+    If-Modified-Since gets a 304 and build() never runs.
+    """
+    etag = '"%s"' % hashlib.sha1(repr(validators).encode()).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = JsonResponse(build())
+
+    response["ETag"] = etag
+    # sent uncompressed: GZipMiddleware would weaken the ETag to W/"..."
+    response.skip_compression = True
+    if timestamp is not None:
+        response["Last-Modified"] = http_date(timestamp)
+    # always revalidate; the 304 path is cheap
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def page_links(page):
+    return {"next": page.next_cursor, "previous": page.previous_cursor}
+
+
+# serializers
+
+def thread_summary(thread):
+    return {
+        "id": thread.id,
+        "title": thread.title,
+        "url": reverse("thread_detail", args=[thread.id]),
+        "author": thread.author.username,
+        "category": {"slug": thread.category.slug, "name": thread.category.name},
+        "tags": [tag.slug for tag in thread.tags.all()],
+        "score": thread.score,
+        "reply_count": thread.reply_count,
+        "created_at": thread.created_at.isoformat(),
+        "updated_at": thread.updated_at.isoformat(),
+    }
+
+
+def reply_data(reply):
+    return {
+        "id": reply.id,
+        "author": reply.author.username,
+        "score": reply.score,
+        "is_deleted": reply.is_deleted,
+        "content_html": None if reply.is_deleted else reply.content_html,
+        "created_at": reply.created_at.isoformat(),
+        "updated_at": reply.updated_at.isoformat(),
+    }
+
+
+def resource_data(resource):
+    return {
+        "id": resource.id,
+        "title": resource.title,
+        "type": resource.resource_type,
+        "link": resource.link,
+        "created_at": resource.created_at.isoformat(),
+    }
+
+
+# views
+
+@api_login_required
+def thread_list(request):
+    threads = Thread.objects.for_listing()
+
+    if request.GET.get("category"):
+        threads = threads.filter(category__slug=request.GET["category"].lower())
+    if request.GET.get("tag"):
+        threads = threads.filter(tags__slug=request.GET["tag"].lower())
+
+    page = CursorPaginator(threads, API_PAGE_SIZE, descending=True).get_page(request.GET)
+
+    # tags come prefetched with the page
+    validators = (
+        [(t.id, t.updated_at, t.score, t.reply_count, [tag.id for tag in t.tags.all()]) for t in page],
+        page_links(page),
+    )
+    last_modified = max((t.updated_at for t in page), default=None)
+
+    return conditional_json(
+        request,
+        validators,
+        last_modified,
+        lambda: {"results": [thread_summary(t) for t in page], **page_links(page)},
+    )
+
+
+@api_login_required
+def thread_detail(request, thread_id):
+    thread = get_object_or_404(
+        Thread.objects.select_related("author", "category"), id=thread_id
+    )
+
+    def build():
+        prefetch_related_objects(
+            [thread],
+            Prefetch("tags", queryset=Tag.objects.only("id", "slug")),
+            "resources",
+        )
+        return {
+            **thread_summary(thread),
+            "content_html": thread.content_html,
+            "is_locked": thread.is_locked,
+            "resources": [resource_data(r) for r in thread.resources.all()],
+            "replies_url": reverse("api_thread_replies", args=[thread.id]),
+        }
+
+    # the version is bumped when tags or resources change (signals.py), so
+    # the 304 path needs no tag or resource queries
+    version = get_versions("thread", [thread.id])[thread.id]
+    validators = (
+        thread.id, thread.updated_at, thread.score, thread.reply_count, thread.is_locked, version
+    )
+    return conditional_json(request, validators, thread.updated_at, build)
+
+
+@api_login_required
+def thread_replies(request, thread_id):
+    thread = get_object_or_404(Thread.objects.only("id"), id=thread_id)
+    replies = Reply.objects.filter(thread=thread).select_related("author")
+    page = CursorPaginator(replies, API_PAGE_SIZE).get_page(request.GET)
+
+    validators = (
+        [(r.id, r.updated_at, r.score, r.is_deleted) for r in page],
+        page_links(page),
+    )
+    last_modified = max((r.updated_at for r in page), default=None)
+
+    return conditional_json(
+        request,
+        validators,
+        last_modified,
+        lambda: {"results": [reply_data(r) for r in page], **page_links(page)},
+    )
+
+
+@api_login_required
+def course_list(request):
+    courses = list(Course.objects.order_by("code"))
+
+    return conditional_json(
+        request,
+        [(c.id, c.code, c.title, c.department) for c in courses],
+        None,
+        lambda: {
+            "results": [
+                {
+                    "id": c.id,
+                    "code": c.code,
+                    "title": c.title,
+                    "department": c.department,
+                    "resources_url": reverse("api_course_resources", args=[c.id]),
+                }
+                for c in courses
+            ]
+        },
+    )
+
+
+@api_login_required
+def course_resources(request, course_id):
+    course = get_object_or_404(Course, id=course_id)
+    resources = Resource.objects.filter(course=course)
+    if request.GET.get("type"):
+        resources = resources.filter(resource_type=request.GET["type"])
+
+    page = CursorPaginator(resources, API_PAGE_SIZE, descending=True).get_page(request.GET)
+
+    # no Last-Modified: resources can be edited (in the admin) and have no
+    # modification time, so only the ETag, built from their fields, is safe
+    validators = (
+        (course.code, course.title),
+        [(r.id, r.title, r.resource_type, r.link) for r in page],
+        page_links(page),
+    )
+
+    return conditional_json(
+        request,
+        validators,
+        None,
+        lambda: {
+            "course": {"id": course.id, "code": course.code, "title": course.title},
+            "results": [resource_data(r) for r in page],
+            **page_links(page),
+        },
+    )
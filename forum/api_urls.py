@@ -0,0 +1,10 @@
+from django.urls import path
+from . import api
+
+urlpatterns = [
+    path("threads/", api.thread_list, name="api_thread_list"),
+    path("threads/<int:thread_id>/", api.thread_detail, name="api_thread_detail"),
+    path("threads/<int:thread_id>/replies/", api.thread_replies, name="api_thread_replies"),
+    path("courses/", api.course_list, name="api_course_list"),
+    path("courses/<int:course_id>/resources/", api.course_resources, name="api_course_resources"),
+]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ForumConfig(AppConfig):
     name = 'forum'
+
+    def ready(self):
+        # notifications registers its job handlers
+        from . import notifications, signals  # noqa: F401
@@ -0,0 +1,106 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+CACHE_ALIAS = getattr(settings, "FORUM_CACHE_ALIAS", "default")
+
+# how long a rendered fragment may live; versions make it safe to be generous
+FRAGMENT_TIMEOUT = getattr(settings, "FORUM_FRAGMENT_TIMEOUT", 60 * 60 * 24)
+
+# course pages are versioned on their resources, but the thread feed on them
+# is not, so it may lag by this much
+COURSE_PAGE_TIMEOUT = getattr(settings, "FORUM_COURSE_PAGE_TIMEOUT", 60 * 10)
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def version_key(kind, obj_id):
+    return f"forum:v:{kind}:{obj_id}"
+
+
+def _fresh_version():
+    # never reuse a number after the version key is evicted, otherwise an old
+    # fragment stored under that number would be served again
+    return time.time_ns() // 1000
+
+
+def get_versions(kind, ids):
+    cache = get_cache()
+    keys = {version_key(kind, obj_id): obj_id for obj_id in ids}
+    found = cache.get_many(keys)
+
+    versions = {keys[key]: value for key, value in found.items()}
+    for key, obj_id in keys.items():
+        if key not in found:
+            value = _fresh_version()
+            cache.add(key, value, None)
+            versions[obj_id] = value
+    return versions
+
+
+async def aget_versions(kind, ids):
+    cache = get_cache()
+    keys = {version_key(kind, obj_id): obj_id for obj_id in ids}
+    found = await cache.aget_many(keys)
+
+    versions = {keys[key]: value for key, value in found.items()}
+    for key, obj_id in keys.items():
+        if key not in found:
+            value = _fresh_version()
+            await cache.aadd(key, value, None)
+            versions[obj_id] = value
+    return versions
+
+
+def attach_versions(kind, objects):
+    # sets obj.cache_version for use in {% cache %} keys
+    versions = get_versions(kind, [obj.id for obj in objects])
+    for obj in objects:
+        obj.cache_version = versions[obj.id]
+    return objects
+
+
+async def aattach_versions(kind, objects):
+    versions = await aget_versions(kind, [obj.id for obj in objects])
+    for obj in objects:
+        obj.cache_version = versions[obj.id]
+    return objects
+
+
+def bump(kind, obj_id):
+    """
+    Invalidate every fragment rendered for one object, once the current
+    transaction commits so no one re-caches the old rows under the new version.
+    """
+    bump_many(kind, [obj_id])
+
+
+def bump_many(kind, ids):
+    ids = list(ids)
+
+    def _bump():
+        cache = get_cache()
+        for obj_id in ids:
+            key = version_key(kind, obj_id)
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, _fresh_version(), None)
+
+    if ids:
+        transaction.on_commit(_bump)
+
+
+def touch_threads(thread_ids):
+    """
+    Record that something visible on these threads' pages changed, for the
+    page validators in conditional.py. "all" covers the thread listings.
+    """
+    thread_ids = list(thread_ids)
+    if thread_ids:
+        bump_many("activity", [*thread_ids, "all"])
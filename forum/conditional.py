@@ -0,0 +1,87 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import caching
+from .notifications import aunread_count
+from .models import Thread
+
+
+# change on deploy so pages rendered by old templates are not revalidated
+ETAG_SALT = getattr(settings, "FORUM_ETAG_SALT", "")
+
+
+class PageValidators:
+    """
+    ETag / Last-Modified for an HTML page, worked out from the cache and
+    at most one small query so a 304 can be sent before the page's own
+    queries run.
+
+    Pages are per user (their votes, their permissions, their CSRF token),
+    so the ETag includes the user, their CSRF secret and the permission
+    generation, and responses are private to the browser.
+    """
+
+    def __init__(self, request, versions, last_modified):
+        self.last_modified = last_modified
+        parts = (
+            ETAG_SALT,
+            request.user.id,
+            request.META.get("CSRF_COOKIE"),
+            request.get_full_path(),
+            versions,
+            last_modified,
+        )
+        self.etag = '"%s"' % hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    @property
+    def timestamp(self):
+        return int(self.last_modified.timestamp()) if self.last_modified else None
+
+    def not_modified(self, request):
+        # a 304 response, or None when the page has to be rendered
+        response = get_conditional_response(
+            request, etag=self.etag, last_modified=self.timestamp
+        )
+        return response and self.apply(response)
+
+    def apply(self, response):
+        if response.status_code in (200, 304):
+            response["ETag"] = self.etag
+            if self.timestamp is not None:
+                response.headers.setdefault("Last-Modified", http_date(self.timestamp))
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Cookie"])
+        return response
+
+
+async def _versions(request, activity_key):
+    # what changes the page besides its rows: activity (votes, replies,
+    # locks) on it, permission changes that alter the buttons shown and
+    # the user's notification badge
+    activity = await caching.aget_versions("activity", [activity_key])
+    perms = await caching.aget_versions("perms", ["all"])
+    unread = await aunread_count(request.user) if request.user.is_authenticated else 0
+    return activity[activity_key], perms["all"], unread
+
+
+async def thread_page_validators(request, thread_id):
+    row = await (
+        Thread.objects.filter(id=thread_id)
+        .annotate(last_reply=Max("replies__updated_at"))
+        .values_list("updated_at", "last_reply")
+        .afirst()
+    )
+    if row is None:
+        return None
+
+    last_modified = max(value for value in row if value is not None)
+    return PageValidators(request, await _versions(request, thread_id), last_modified)
+
+
+async def thread_list_validators(request):
+    last_modified = (await Thread.objects.aaggregate(last=Max("updated_at")))["last"]
+    return PageValidators(request, await _versions(request, "all"), last_modified)
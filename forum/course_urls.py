@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("", views.course_catalog, name="course_catalog"),
+    path("<int:course_id>/", views.course_detail, name="course_detail"),
+    path("department/<str:department>/", views.department_detail, name="department_detail"),
+]
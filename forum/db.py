@@ -0,0 +1,46 @@
+import random
+import time
+from functools import wraps
+
+from django.db import OperationalError
+
+from . import metrics
+
+
+LOCK_ERRORS = ("database is locked", "database table is locked", "deadlock detected")
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return any(text in message for text in LOCK_ERRORS)
+
+
+def retry_on_lock(timeout=5.0, base_delay=0.01, max_delay=0.25):
+    """
+    Retry a write that lost a lock race (SQLite "database is locked",
+    Postgres deadlocks) with jittered exponential backoff, for up to
+    `timeout` seconds. The wrapped function must own its transaction so
+    every attempt starts clean.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            deadline = time.monotonic() + timeout
+            attempt = 0
+
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except OperationalError as exc:
+                    if not is_lock_error(exc) or time.monotonic() >= deadline:
+                        raise
+                    metrics.inc("forum_db_lock_retries_total")
+
+                delay = min(max_delay, base_delay * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+                attempt += 1
+
+        return wrapper
+
+    return decorator
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Reply, Thread
+from .models import Course, Reply, Resource, Thread
 
 
 class ReplyForm(forms.ModelForm):
@@ -11,6 +11,16 @@ class ReplyForm(forms.ModelForm):
         }
 
 class ThreadForm(forms.ModelForm):
+    # optionally share a new resource along with the thread
+    resource_course = forms.ModelChoiceField(
+        queryset=Course.objects.order_by("code"), required=False
+    )
+    resource_title = forms.CharField(max_length=200, required=False)
+    resource_type = forms.ChoiceField(
+        choices=Resource.RESOURCE_TYPES, initial="link", required=False
+    )
+    resource_url = forms.URLField(required=False)
+
     class Meta:
         model = Thread
         fields = ["title", "content", "category", "tags", "resources"]
@@ -19,4 +29,19 @@ class ThreadForm(forms.ModelForm):
             "tags": forms.CheckboxSelectMultiple()
         }
 
-        
\ No newline at end of file
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("resource_url") and not cleaned_data.get("resource_course"):
+            self.add_error("resource_course", "Pick the course this resource belongs to.")
+        return cleaned_data
+
+    def new_resource(self):
+        # unsaved Resource for the shared link, or None
+        if not self.cleaned_data.get("resource_url"):
+            return None
+        return Resource(
+            course=self.cleaned_data["resource_course"],
+            title=self.cleaned_data["resource_title"] or "Shared Resource",
+            resource_type=self.cleaned_data["resource_type"] or "link",
+            link=self.cleaned_data["resource_url"],
+        )
@@ -0,0 +1,237 @@
+import logging
+import statistics
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job, JobLock, Reply, Thread
+from .performance import percentile
+from .ranking import rerank_stale
+from .search import get_backend as get_search_backend
+
+
+logger = logging.getLogger(__name__)
+
+# a claimed job not finished within this many seconds is handed out again
+LEASE = getattr(settings, "FORUM_JOB_LEASE", 300)
+MAX_ATTEMPTS = getattr(settings, "FORUM_JOB_MAX_ATTEMPTS", 5)
+# retries wait RETRY_DELAY * 2 ** (attempts - 1) seconds, capped
+RETRY_DELAY = getattr(settings, "FORUM_JOB_RETRY_DELAY", 10)
+MAX_RETRY_DELAY = 60 * 60
+
+CLAIM_LOCK = "claim"
+
+_handlers = {}
+
+
+def handler(name):
+    """Register a function as the handler for jobs called name."""
+
+    def register(func):
+        _handlers[name] = func
+        return func
+
+    return register
+
+
+def enqueue(name, payload=None, unique_key=None, delay=0):
+    """
+    Queue a job. The row is written in the caller's transaction, so the job
+    exists only if the write that caused it commits. With unique_key the
+    call is a no-op while an identical job is still waiting.
+    """
+    Job.objects.bulk_create(
+        [
+            Job(
+                name=name,
+                payload=payload or {},
+                unique_key=unique_key,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+        ],
+        ignore_conflicts=unique_key is not None,
+    )
+
+
+def enqueue_many(name, payloads, unique_keys=None):
+    """enqueue() for many jobs of one kind in a single INSERT."""
+    unique_keys = unique_keys or [None] * len(payloads)
+    now = timezone.now()
+    Job.objects.bulk_create(
+        [
+            Job(name=name, payload=payload, unique_key=unique_key, run_at=now)
+            for payload, unique_key in zip(payloads, unique_keys)
+        ],
+        ignore_conflicts=any(key is not None for key in unique_keys),
+    )
+
+
+def _ready(now):
+    # waiting jobs that are due, plus running ones whose worker went away
+    return Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now)
+
+
+def _lock_claims(worker_id, now):
+    # SQLite has no row locks; updating the lock row takes the database
+    # write lock, so competing workers claim one after another
+    updated = JobLock.objects.filter(name=CLAIM_LOCK).update(holder=worker_id, acquired_at=now)
+    if not updated:
+        JobLock.objects.create(name=CLAIM_LOCK, holder=worker_id, acquired_at=now)
+
+
+def claim(worker_id, batch_size=10):
+    """
+    Mark up to batch_size due jobs as running for this worker and return
+    them. Concurrent workers never get the same job: on PostgreSQL rows
+    locked by another worker are skipped (FOR UPDATE SKIP LOCKED), elsewhere
+    claims are serialized through the JobLock table.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        ready = Job.objects.filter(_ready(now)).order_by("run_at", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        else:
+            _lock_claims(worker_id, now)
+
+        ids = list(ready.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return []
+
+        Job.objects.filter(id__in=ids).update(
+            status=Job.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=LEASE),
+            started_at=now,
+        )
+
+    return list(Job.objects.filter(id__in=ids).order_by("run_at", "id"))
+
+
+def _finish(job, **fields):
+    # only if the lease is still ours; a worker that outlived it must not
+    # overwrite whoever took the job over
+    return Job.objects.filter(id=job.id, status=Job.RUNNING, locked_by=job.locked_by).update(
+        finished_at=timezone.now(), **fields
+    )
+
+
+def _retry(job, error, duration_ms):
+    if job.attempts >= MAX_ATTEMPTS:
+        _finish(job, status=Job.FAILED, last_error=error, duration_ms=duration_ms)
+        logger.error("job %s #%s failed for good after %s attempts", job.name, job.id, job.attempts)
+        return
+
+    delay = min(RETRY_DELAY * 2 ** (job.attempts - 1), MAX_RETRY_DELAY)
+    try:
+        with transaction.atomic():
+            _finish(
+                job,
+                status=Job.QUEUED,
+                run_at=timezone.now() + timedelta(seconds=delay),
+                last_error=error,
+                duration_ms=duration_ms,
+            )
+    except IntegrityError:
+        # the same work was queued again meanwhile; that job covers it
+        Job.objects.filter(id=job.id, locked_by=job.locked_by).delete()
+    logger.warning("job %s #%s failed, retrying in %ss", job.name, job.id, delay)
+
+
+def run(job):
+    """
+    Run one claimed job. Returns True if it succeeded. Handlers manage
+    their own transactions and must be safe to run twice.
+    """
+    start = time.perf_counter()
+    try:
+        func = _handlers.get(job.name)
+        if func is None:
+            raise LookupError(f"No handler registered for job {job.name!r}")
+        func(**job.payload)
+    except Exception:
+        _retry(job, traceback.format_exc(), (time.perf_counter() - start) * 1000)
+        return False
+
+    duration_ms = (time.perf_counter() - start) * 1000
+    _finish(job, status=Job.DONE, last_error="", duration_ms=duration_ms)
+    logger.info("job %s #%s done in %.1f ms", job.name, job.id, duration_ms)
+    return True
+
+
+def run_batch(worker_id="inline", batch_size=10):
+    """Claim and run one batch. Returns the number of jobs run."""
+    jobs = claim(worker_id, batch_size)
+    for job in jobs:
+        run(job)
+    return len(jobs)
+
+
+def run_pending(worker_id="inline", batch_size=100):
+    """Run batches until nothing is due, e.g. in tests or a cron job."""
+    total = 0
+    while count := run_batch(worker_id, batch_size):
+        total += count
+    return total
+
+
+def purge(older_than):
+    """Delete finished jobs older than the timedelta; failed ones are kept."""
+    deleted, _ = Job.objects.filter(
+        status=Job.DONE, finished_at__lt=timezone.now() - older_than
+    ).delete()
+    return deleted
+
+
+def metrics(since):
+    """
+    Per job name: counts by status and run-time percentiles (ms) of the
+    jobs finished since the given datetime, plus the current backlog.
+    """
+    rows = {}
+
+    for name, status, duration in Job.objects.filter(finished_at__gte=since).values_list(
+        "name", "status", "duration_ms"
+    ).order_by():
+        row = rows.setdefault(name, {"done": 0, "failed": 0, "queued": 0, "durations": []})
+        if status in (Job.DONE, Job.FAILED):
+            row[status] += 1
+        if status == Job.DONE and duration is not None:
+            row["durations"].append(duration)
+
+    for name in Job.objects.filter(status=Job.QUEUED).values_list("name", flat=True).order_by():
+        rows.setdefault(name, {"done": 0, "failed": 0, "queued": 0, "durations": []})["queued"] += 1
+
+    for row in rows.values():
+        durations = row.pop("durations")
+        row["p50"] = statistics.median(durations) if durations else None
+        row["p95"] = percentile(durations, 95) if durations else None
+        row["max"] = max(durations) if durations else None
+    return rows
+
+
+# handlers for the forum's own side effects
+
+@handler("search.sync")
+def sync_search(kind, id):
+    # idempotent: index the current row, or drop it if gone or hidden
+    model = Thread if kind == "thread" else Reply
+    obj = model.objects.filter(id=id).first()
+    if obj is None:
+        get_search_backend().remove(kind, id)
+    elif kind == "thread":
+        get_search_backend().index_thread(obj)
+    else:
+        get_search_backend().index_reply(obj)
+
+
+@handler("rank_threads")
+def rank_threads():
+    rerank_stale()
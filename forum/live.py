@@ -0,0 +1,180 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+
+# Thread pages subscribe to live updates only when this is on, and the
+# stream is only served to ASGI requests: under WSGI an endless response
+# would hold a worker for as long as the tab stays open.
+ENABLED = getattr(settings, "FORUM_LIVE_UPDATES", False)
+
+# seconds between ": ping" comments so proxies keep idle streams open
+HEARTBEAT = getattr(settings, "FORUM_LIVE_HEARTBEAT", 20)
+
+# connections one worker process will hold open, in total and per user
+MAX_CONNECTIONS = getattr(settings, "FORUM_LIVE_MAX_CONNECTIONS", 1000)
+MAX_CONNECTIONS_PER_USER = getattr(settings, "FORUM_LIVE_MAX_CONNECTIONS_PER_USER", 4)
+
+# events buffered for one slow client before it starts missing some
+QUEUE_SIZE = 100
+
+
+class Subscription:
+    def __init__(self, broker, thread_id):
+        self.broker = broker
+        self.thread_id = thread_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(QUEUE_SIZE)
+
+    def deliver(self, message):
+        # called from any thread; hand the message to the subscriber's loop
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Fan-out to the SSE streams of this process only. With several worker
+    processes, point FORUM_LIVE_BROKER at a broker that relays publish()
+    between them (Redis pub/sub, Postgres LISTEN/NOTIFY, ...) and calls
+    deliver() on its local subscriptions.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, thread_id):
+        subscription = Subscription(self, thread_id)
+        with self.lock:
+            self.subscriptions[thread_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.thread_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[subscription.thread_id]
+
+    def publish(self, thread_id, message):
+        with self.lock:
+            subscribers = list(self.subscriptions.get(thread_id, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, "FORUM_LIVE_BROKER", None)
+                _broker = import_string(path)() if path else InProcessBroker()
+    return _broker
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def publish(thread_id, event, **data):
+    """
+    Push an event to everyone watching the thread, once the current
+    transaction commits, so rolled back writes are never announced.
+    """
+    message = format_event(event, data)
+    transaction.on_commit(lambda: get_broker().publish(thread_id, message))
+
+
+class ConnectionLimiter:
+    """Per-process caps on open streams, overall and per user."""
+
+    def __init__(self, total=MAX_CONNECTIONS, per_user=MAX_CONNECTIONS_PER_USER):
+        self.total = total
+        self.per_user = per_user
+        self.open = 0
+        self.by_user = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def acquire(self, user_id):
+        with self.lock:
+            if self.open >= self.total or self.by_user[user_id] >= self.per_user:
+                return False
+            self.open += 1
+            self.by_user[user_id] += 1
+            return True
+
+    def release(self, user_id):
+        with self.lock:
+            self.open -= 1
+            self.by_user[user_id] -= 1
+            if not self.by_user[user_id]:
+                del self.by_user[user_id]
+
+
+limiter = ConnectionLimiter()
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    Streams one subscription as text/event-stream: the reconnect delay,
+    then events as they are published, with heartbeats in between. Closing
+    the response (client gone, server shutting down) frees the
+    subscription and the connection slot, even if streaming never started.
+    """
+
+    def __init__(self, subscription, user_id):
+        self.subscription = subscription
+        self.user_id = user_id
+        self.released = False
+        self.release_lock = threading.Lock()
+        super().__init__(self.events(), content_type="text/event-stream")
+        self["Cache-Control"] = "no-cache"
+        self["X-Accel-Buffering"] = "no"
+
+    async def events(self):
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    yield await self.subscription.get(HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+        finally:
+            self.release()
+
+    def release(self):
+        # runs from the stream's finally and from close(), whichever is first
+        with self.release_lock:
+            if self.released:
+                return
+            self.released = True
+        self.subscription.close()
+        limiter.release(self.user_id)
+
+    def close(self):
+        self.release()
+        super().close()
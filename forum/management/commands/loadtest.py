@@ -0,0 +1,177 @@
+import asyncio
+import io
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from forum.performance import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the WSGI and ASGI handlers in-process with concurrent readers "
+        "and compare throughput and latency percentiles"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=["/threads/"],
+            help="Paths to request, cycled through (default: /threads/)",
+        )
+        parser.add_argument("--user", required=True, help="Username to log in as")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--mode",
+            choices=["both", "wsgi", "asgi"],
+            default="both",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        self.host = next((h for h in settings.ALLOWED_HOSTS if "*" not in h), "localhost").lstrip(".")
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={self.login(user)}"
+        self.paths = options["paths"]
+
+        total = options["requests"]
+        concurrency = options["concurrency"]
+
+        modes = ["wsgi", "asgi"] if options["mode"] == "both" else [options["mode"]]
+        results = {}
+
+        for mode in modes:
+            runner = self.run_wsgi if mode == "wsgi" else self.run_asgi
+            # one warm-up pass so both modes start with the same cache state
+            runner(min(total, concurrency), concurrency)
+            results[mode] = runner(total, concurrency)
+
+        self.report(results, concurrency)
+
+    def login(self, user):
+        session = SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def split(self, path):
+        path, _, query = path.partition("?")
+        return path, query
+
+    # WSGI: a thread pool of readers, like a threaded WSGI server
+
+    def run_wsgi(self, total, concurrency):
+        handler = WSGIHandler()
+
+        def one(i):
+            path, query = self.split(self.paths[i % len(self.paths)])
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": query,
+                "SERVER_NAME": self.host,
+                "SERVER_PORT": "80",
+                "HTTP_HOST": self.host,
+                "HTTP_COOKIE": self.cookie,
+                "REMOTE_ADDR": "127.0.0.1",
+                "wsgi.input": io.BytesIO(),
+                "wsgi.errors": io.StringIO(),
+                "wsgi.url_scheme": "http",
+            }
+            status = []
+            start = time.perf_counter()
+            response = handler(environ, lambda s, headers, exc_info=None: status.append(s))
+            b"".join(response)
+            response.close()
+            elapsed = time.perf_counter() - start
+            return elapsed, int(status[0].split()[0])
+
+        def worker(indexes):
+            try:
+                return [one(i) for i in indexes]
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            chunks = [range(n, total, concurrency) for n in range(concurrency)]
+            samples = [s for chunk in pool.map(worker, chunks) for s in chunk]
+        return samples, time.perf_counter() - started
+
+    # ASGI: concurrent coroutines on one event loop, like uvicorn/daphne
+
+    def run_asgi(self, total, concurrency):
+        return asyncio.run(self._run_asgi(total, concurrency))
+
+    async def _run_asgi(self, total, concurrency):
+        handler = ASGIHandler()
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            path, query = self.split(self.paths[i % len(self.paths)])
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": query.encode(),
+                "root_path": "",
+                "headers": [(b"host", self.host.encode()), (b"cookie", self.cookie.encode())],
+                "client": ("127.0.0.1", 0),
+                "server": (self.host, 80),
+            }
+            status = []
+            body_sent = asyncio.Event()
+
+            async def receive():
+                if not body_sent.is_set():
+                    body_sent.set()
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # the client never disconnects; Django cancels this wait
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            async with gate:
+                start = time.perf_counter()
+                await handler(scope, receive, send)
+                return time.perf_counter() - start, status[0]
+
+        started = time.perf_counter()
+        samples = await asyncio.gather(*(one(i) for i in range(total)))
+        return samples, time.perf_counter() - started
+
+    def report(self, results, concurrency):
+        self.stdout.write(
+            f"{'mode':<6}{'reqs':>7}{'errors':>8}{'req/s':>10}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}   (concurrency {concurrency})"
+        )
+        for mode, (samples, wall) in results.items():
+            latencies = [elapsed * 1000 for elapsed, _ in samples]
+            errors = sum(1 for _, status in samples if status >= 400)
+            self.stdout.write(
+                f"{mode:<6}{len(samples):>7}{errors:>8}{len(samples) / wall:>10.1f}"
+                f"{statistics.median(latencies):>10.1f}"
+                f"{percentile(latencies, 95):>10.1f}{percentile(latencies, 99):>10.1f}"
+            )
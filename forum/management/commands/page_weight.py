@@ -0,0 +1,81 @@
+import gzip
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+
+STYLESHEET_RE = re.compile(r'<link rel="stylesheet" href="([^"]+)"')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what each page costs on the wire now that CSS lives in "
+        "cacheable static files, against the same CSS inlined in every response"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=["/threads/"],
+            help="Paths to measure (default: /threads/)",
+        )
+        parser.add_argument("--user", required=True, help="Username to log in as")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        host = next((h for h in settings.ALLOWED_HOSTS if "*" not in h), "localhost").lstrip(".")
+        client = Client(HTTP_HOST=host)
+        client.force_login(user)
+
+        self.stdout.write(
+            f"{'path':<32}{'before':>8}{'inline gz':>11}{'html':>8}{'html gz':>9}"
+            f"{'css':>8}{'saved/view':>12}"
+        )
+        for path in options["paths"]:
+            response = client.get(path, HTTP_ACCEPT_ENCODING="gzip")
+            if response.status_code != 200:
+                self.stdout.write(self.style.WARNING(f"{path:<32}HTTP {response.status_code}"))
+                continue
+
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+            if response.get("Content-Encoding") == "gzip":
+                wire, html = len(body), gzip.decompress(body)
+            else:
+                wire, html = len(gzip.compress(body)), body
+
+            css = b"".join(self.stylesheet(href) for href in STYLESHEET_RE.findall(html.decode()))
+
+            # what the page weighed with the same CSS in an inline <style>,
+            # as it was shipped (uncompressed) and with gzip alone
+            before = len(html) + len(css)
+            inline = len(gzip.compress(html + css))
+
+            self.stdout.write(
+                f"{path:<32}{before:>8}{inline:>11}{len(html):>8}{wire:>9}"
+                f"{len(css):>8}{before - wire:>12}"
+            )
+
+        self.stdout.write(
+            "sizes in bytes; css is downloaded once and then served from the browser cache"
+        )
+
+    def stylesheet(self, href):
+        name = href.removeprefix(settings.STATIC_URL).removeprefix("/")
+        if staticfiles_storage.exists(name):
+            with staticfiles_storage.open(name) as f:
+                return f.read()
+        found = finders.find(name)
+        if not found:
+            raise CommandError(f"Stylesheet {href} not found")
+        with open(found, "rb") as f:
+            return f.read()
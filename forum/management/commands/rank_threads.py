@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from forum.models import Thread
+from forum.ranking import rerank_stale
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute hot_rank for threads with new votes or replies since the "
+        "last run; schedule it every minute or so"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-rank every thread, e.g. after changing the formula in ranking.py",
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            Thread.objects.update(rank_stale=True)
+
+        total = rerank_stale(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Re-ranked {total} threads"))
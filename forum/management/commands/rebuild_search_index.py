@@ -0,0 +1,74 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from forum.models import Reply, Thread
+from forum.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Bulk (re)index threads and replies for full-text search"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches so other writers get the lock",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Empty the index before rebuilding",
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        batch_size = options["batch_size"]
+        pause = options["pause"]
+
+        if options["clear"]:
+            backend.clear()
+
+        threads = Thread.objects.values_list("id", "title", "content")
+        total = self.index(
+            backend,
+            "thread",
+            threads,
+            batch_size,
+            pause,
+            row=lambda r: (r[0], r[0], r[1], r[2]),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} threads"))
+
+        replies = Reply.objects.filter(is_deleted=False).values_list(
+            "id", "thread_id", "content"
+        )
+        total = self.index(
+            backend,
+            "reply",
+            replies,
+            batch_size,
+            pause,
+            row=lambda r: (r[0], r[1], "", r[2]),
+        )
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} replies"))
+
+    def index(self, backend, kind, queryset, batch_size, pause, row):
+        # walk by primary key so each batch is its own short transaction
+        total = 0
+        last_id = 0
+
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by("id")[:batch_size])
+            if not batch:
+                return total
+
+            backend.index_many(kind, [row(r) for r in batch])
+            total += len(batch)
+            last_id = batch[-1][0]
+
+            self.stdout.write(f"  {kind}: {total}")
+            if pause:
+                time.sleep(pause)
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from forum import caching
+from forum.models import Reply, Thread, Vote
+
+
+COUNTER_FIELDS = ["score", "upvote_count", "downvote_count"]
+
+
+class Command(BaseCommand):
+    help = "Rebuild cached vote counters on threads and replies from Vote rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, do not write anything",
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options["dry_run"]
+
+        for model, fk, label in ((Thread, "thread", "threads"), (Reply, "reply", "replies")):
+            drifted = self.rebuild(model, fk, dry_run)
+
+            if drifted:
+                verb = "would be fixed" if dry_run else "fixed"
+                self.stdout.write(
+                    self.style.WARNING(f"{drifted} {label} had drifted counters ({verb})")
+                )
+            else:
+                self.stdout.write(self.style.SUCCESS(f"All {label} counters are in sync"))
+
+    def rebuild(self, model, fk, dry_run):
+        totals = {
+            row[fk]: row
+            for row in Vote.objects.filter(**{f"{fk}__isnull": False})
+            .values(fk)
+            .annotate(
+                score=Sum("value"),
+                upvote_count=Count("id", filter=Q(value=Vote.UPVOTE)),
+                downvote_count=Count("id", filter=Q(value=Vote.DOWNVOTE)),
+            )
+            .order_by()
+        }
+
+        stale = []
+        fields = ["id", *COUNTER_FIELDS] + (["thread_id"] if model is Reply else [])
+        for obj in model.objects.only(*fields).iterator():
+            expected = totals.get(obj.id, {})
+            changed = False
+
+            for field in COUNTER_FIELDS:
+                value = expected.get(field) or 0
+                if getattr(obj, field) != value:
+                    self.stdout.write(
+                        f"{fk} {obj.id}: {field} {getattr(obj, field)} -> {value}"
+                    )
+                    setattr(obj, field, value)
+                    changed = True
+
+            if changed:
+                stale.append(obj)
+
+        if stale and not dry_run:
+            # bulk_update skips auto_now; the API's Last-Modified needs it
+            now = timezone.now()
+            for obj in stale:
+                obj.updated_at = now
+            with transaction.atomic():
+                model.objects.bulk_update(stale, [*COUNTER_FIELDS, "updated_at"], batch_size=500)
+                if model is Thread:
+                    # let rank_threads pick up the corrected scores
+                    model.objects.filter(id__in=[obj.id for obj in stale]).update(rank_stale=True)
+                # the fixed scores are shown inside cached thread cards and replies
+                caching.bump_many(fk, [obj.id for obj in stale])
+                caching.touch_threads({getattr(obj, "thread_id", obj.id) for obj in stale})
+
+        return len(stale)
@@ -0,0 +1,68 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from forum import caching
+from forum.models import Reply, Thread
+from forum.rendering import RENDERER_VERSION
+
+
+class Command(BaseCommand):
+    help = "Regenerate stored content_html for threads and replies rendered by an older renderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0.0,
+            help="Seconds to sleep between batches so other writers get the lock",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render everything, not just rows behind the current renderer version",
+        )
+
+    def handle(self, *args, **options):
+        for model, kind, label in ((Thread, "thread", "threads"), (Reply, "reply", "replies")):
+            total = self.rerender(model, kind, options)
+            self.stdout.write(
+                self.style.SUCCESS(f"Re-rendered {total} {label} (renderer v{RENDERER_VERSION})")
+            )
+
+    def rerender(self, model, kind, options):
+        fields = ["id", "content", "content_html", "content_html_version"]
+        if model is Reply:
+            fields.append("thread_id")
+        queryset = model.objects.only(*fields)
+        if not options["all"]:
+            queryset = queryset.filter(content_html_version__lt=RENDERER_VERSION)
+
+        total = 0
+        last_id = 0
+
+        while True:
+            batch = list(queryset.filter(id__gt=last_id).order_by("id")[: options["batch_size"]])
+            if not batch:
+                return total
+
+            now = timezone.now()
+            for obj in batch:
+                obj.render_content()
+                obj.updated_at = now  # bulk_update skips auto_now
+
+            with transaction.atomic():
+                model.objects.bulk_update(batch, ["content_html", "content_html_version", "updated_at"])
+                for obj in batch:
+                    caching.bump(kind, obj.id)
+                caching.touch_threads({getattr(obj, "thread_id", obj.id) for obj in batch})
+
+            total += len(batch)
+            last_id = batch[-1].id
+            self.stdout.write(f"  {kind}: {total}")
+
+            if options["pause"]:
+                time.sleep(options["pause"])
@@ -0,0 +1,89 @@
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from forum import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (search indexing, re-ranking, ...) until "
+        "stopped; start as many as needed, they never run the same job twice"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10)
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when the queue is empty (default: 1)",
+        )
+        parser.add_argument("--once", action="store_true", help="Run what is due now and exit")
+        parser.add_argument(
+            "--keep-days",
+            type=int,
+            default=7,
+            help="Delete finished jobs older than this, checked hourly (default: 7)",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Print per-job counts and run times for the last hour and exit",
+        )
+
+    def handle(self, *args, **options):
+        if options["stats"]:
+            self.print_stats()
+            return
+
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        keep = timedelta(days=options["keep_days"])
+
+        if options["once"]:
+            total = jobs.run_pending(worker_id, options["batch_size"])
+            self.stdout.write(self.style.SUCCESS(f"Ran {total} jobs"))
+            return
+
+        # finish the current batch on SIGTERM instead of dying mid-job
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f"Worker {worker_id} started")
+        next_purge = 0.0
+        while not self.stopping:
+            close_old_connections()
+            if time.monotonic() >= next_purge:
+                jobs.purge(keep)
+                next_purge = time.monotonic() + 60 * 60
+
+            if not jobs.run_batch(worker_id, options["batch_size"]):
+                time.sleep(options["sleep"])
+
+        self.stdout.write(f"Worker {worker_id} stopped")
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def print_stats(self):
+        rows = jobs.metrics(timezone.now() - timedelta(hours=1))
+        self.stdout.write(
+            f"{'job':<20}{'done':>7}{'failed':>8}{'queued':>8}"
+            f"{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}"
+        )
+
+        def ms(value):
+            return f"{value:>10.1f}" if value is not None else f"{'-':>10}"
+
+        for name, row in sorted(rows.items()):
+            self.stdout.write(
+                f"{name:<20}{row['done']:>7}{row['failed']:>8}{row['queued']:>8}"
+                f"{ms(row['p50'])}{ms(row['p95'])}{ms(row['max'])}"
+            )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from forum.notifications import send_digests
+
+
+class Command(BaseCommand):
+    help = (
+        "Write one notification per digest subscriber summing up new replies "
+        "in the threads they follow; schedule it daily or hourly"
+    )
+
+    def handle(self, *args, **options):
+        total = send_digests()
+        self.stdout.write(self.style.SUCCESS(f"Sent {total} digests"))
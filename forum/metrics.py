@@ -0,0 +1,241 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache.backends.base import BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+
+# With several worker processes, set this to a directory they all share
+# (emptied on deploy): each process writes its own numbers there and
+# /metrics adds them up. Unset, /metrics shows the serving process only.
+METRICS_DIR = getattr(settings, "FORUM_METRICS_DIR", None)
+# how stale another process's numbers may be
+FLUSH_INTERVAL = getattr(settings, "FORUM_METRICS_FLUSH_INTERVAL", 1.0)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+METRICS = {
+    "forum_request_duration_seconds": (HISTOGRAM, "Request wall time by URL name"),
+    "forum_requests_total": (COUNTER, "Requests by URL name and status class"),
+    "forum_db_queries_total": (COUNTER, "SQL queries run by requests, by URL name"),
+    "forum_db_query_seconds_total": (COUNTER, "Time spent in SQL by requests, by URL name"),
+    "forum_db_lock_errors_total": (COUNTER, "Queries that failed waiting for a database lock"),
+    "forum_db_lock_retries_total": (COUNTER, "Writes retried after losing a lock race"),
+    "forum_cache_requests_total": (COUNTER, "Cache reads by key family and result"),
+    "forum_created_total": (COUNTER, "Threads, replies, votes and reports created"),
+}
+
+
+class Store:
+    """
+    One process's metric values. Updates are dict operations under a lock
+    no other process ever takes; in shared-file mode the values are copied
+    to this process's own file at most once per FLUSH_INTERVAL.
+    """
+
+    def __init__(self, directory=None):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.directory = directory
+        # pid plus a random part, so a recycled pid never takes over (and
+        # shrinks) the counters of a dead process
+        self.path = directory and os.path.join(
+            directory, f"forum-{os.getpid()}-{uuid.uuid4().hex[:8]}.json"
+        )
+        self.flushed_at = 0.0
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+        with self.lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [list(buckets), [0] * (len(buckets) + 1), 0.0]
+            entry[1][index] += 1
+            entry[2] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": [[name, labels, value] for (name, labels), value in self.counters.items()],
+                "histograms": [
+                    [name, labels, list(bounds), list(counts), total]
+                    for (name, labels), (bounds, counts, total) in self.histograms.items()
+                ],
+            }
+
+    def maybe_flush(self):
+        if self.path and time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if not self.path:
+            return
+        self.flushed_at = time.monotonic()
+        data = json.dumps(self.snapshot())
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = f"{self.path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(data)
+        # readers only ever see a whole file
+        os.replace(tmp, self.path)
+
+    def collect(self):
+        """This process's values plus every other process's last flush."""
+        snapshots = [self.snapshot()]
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if not name.endswith(".json") or path == self.path:
+                    continue
+                try:
+                    with open(path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # removed or replaced while listing
+        return merge(snapshots)
+
+
+def merge(snapshots):
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, bounds, counts, total in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            entry = histograms.setdefault(key, [bounds, [0] * len(counts), 0.0])
+            entry[1] = [a + b for a, b in zip(entry[1], counts)]
+            entry[2] += total
+    return counters, histograms
+
+
+store = Store(METRICS_DIR)
+atexit.register(store.flush)
+
+
+def inc(name, amount=1, **labels):
+    store.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    store.observe(name, value, **labels)
+
+
+def _labels(pairs, extra=()):
+    pairs = list(pairs) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    counters, histograms = store.collect()
+    lines = []
+
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+        if kind == COUNTER:
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            continue
+
+        for (metric, labels), (bounds, counts, total) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip([*bounds, math.inf], counts):
+                cumulative += count
+                lines.append(
+                    f"{name}_bucket{_labels(labels, [('le', _number(bound))])} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"
+
+
+# cache hit ratios; use these in CACHES instead of Django's classes
+
+def key_family(key):
+    # a bounded label from a cache key: "forum:v:thread:3" -> "forum:v",
+    # template fragments by fragment name
+    if key.startswith("template.cache."):
+        return "fragment:" + key.split(".")[2]
+    return ":".join(key.split(":")[:2])
+
+
+_MISSING = object()
+
+
+def _uses_base_get_many(cache):
+    # LocMem and FileBased keep BaseCache's loop over get(); Redis fetches
+    # all keys in one round trip and has to be counted here
+    return getattr(super(CountingCacheMixin, cache).get_many, "__func__", None) is BaseCache.get_many
+
+
+class CountingCacheMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        hit = value is not _MISSING
+        inc("forum_cache_requests_total", family=key_family(key), result="hit" if hit else "miss")
+        return value if hit else default
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        found = super().get_many(keys, version)
+        if _uses_base_get_many(self):
+            return found  # BaseCache.get_many calls self.get(), already counted
+        for key in keys:
+            inc(
+                "forum_cache_requests_total",
+                family=key_family(key),
+                result="hit" if key in found else "miss",
+            )
+        return found
+
+
+class CountingLocMemCache(CountingCacheMixin, LocMemCache):
+    pass
+
+
+class CountingFileBasedCache(CountingCacheMixin, FileBasedCache):
+    pass
+
+
+class CountingRedisCache(CountingCacheMixin, RedisCache):
+    pass
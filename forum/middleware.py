@@ -0,0 +1,76 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware as BaseGZipMiddleware
+from django.db import connections
+
+from . import performance
+
+
+class GZipMiddleware(BaseGZipMiddleware):
+    """
+    Django's GZipMiddleware, minus server-sent event streams (gzip holds
+    back small writes, so events would sit in the buffer instead of
+    reaching the browser) and responses marked skip_compression, such as
+    the JSON API's, whose strong ETags gzip would turn into weak ones.
+    """
+
+    def process_response(self, request, response):
+        if response.get("Content-Type", "").startswith("text/event-stream"):
+            return response
+        if getattr(response, "skip_compression", False):
+            return response
+        return super().process_response(request, response)
+
+
+class PerformanceMiddleware:
+    """
+    Measures each request: wall time, SQL query count and time, template
+    render time and response size. Sends them as a Server-Timing header
+    (shown in the browser's network panel), feeds the staff performance
+    page and logs requests over FORUM_QUERY_BUDGET queries.
+
+    List it first in MIDDLEWARE so the time covers the other middleware
+    and the size is what goes over the wire.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    # FORUM_SERVER_TIMING = False keeps the numbers off the responses
+    server_timing = getattr(settings, "FORUM_SERVER_TIMING", True)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # connections opened before the signal receiver was connected
+        for connection in connections.all(initialized_only=True):
+            performance.install(connection)
+
+        stats = performance.RequestStats()
+        token = performance.current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            performance.current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = performance.RequestStats()
+        token = performance.current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            performance.current.reset(token)
+        return self.finish(request, response, stats)
+
+    def finish(self, request, response, stats):
+        timing = performance.finish(request, response, stats)
+        if self.server_timing:
+            response["Server-Timing"] = timing
+        return response
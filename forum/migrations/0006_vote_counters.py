@@ -0,0 +1,68 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:56
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    Vote = apps.get_model("forum", "Vote")
+
+    for model_name, fk in (("Thread", "thread"), ("Reply", "reply")):
+        model = apps.get_model("forum", model_name)
+        rows = (
+            Vote.objects.filter(**{f"{fk}__isnull": False})
+            .values(fk)
+            .annotate(
+                total=Sum("value"),
+                up=Count("id", filter=Q(value=1)),
+                down=Count("id", filter=Q(value=-1)),
+            )
+            .order_by()
+        )
+        for row in rows:
+            model.objects.filter(id=row[fk]).update(
+                score=row["total"] or 0,
+                upvote_count=row["up"],
+                downvote_count=row["down"],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0005_thread_resources'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reply',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reply',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='downvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='upvote_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
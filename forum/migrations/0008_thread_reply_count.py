@@ -0,0 +1,34 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:58
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reply_count(apps, schema_editor):
+    Reply = apps.get_model("forum", "Reply")
+    Thread = apps.get_model("forum", "Thread")
+
+    rows = (
+        Reply.objects.filter(is_deleted=False)
+        .values("thread")
+        .annotate(total=Count("id"))
+        .order_by()
+    )
+    for row in rows:
+        Thread.objects.filter(id=row["thread"]).update(reply_count=row["total"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0007_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reply_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+
+
+SQLITE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS forum_search USING fts5(
+    kind UNINDEXED,
+    object_id UNINDEXED,
+    thread_id UNINDEXED,
+    title,
+    body,
+    tokenize = 'porter unicode61'
+)
+"""
+
+POSTGRES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS forum_search (
+        rowid bigint PRIMARY KEY,
+        kind varchar(10) NOT NULL,
+        object_id bigint NOT NULL,
+        thread_id bigint NOT NULL,
+        title text NOT NULL DEFAULT '',
+        body text NOT NULL DEFAULT '',
+        document tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', title), 'A')
+            || setweight(to_tsvector('english', body), 'B')
+        ) STORED
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS forum_search_document_idx ON forum_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS forum_search_thread_idx ON forum_search (thread_id)",
+]
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "sqlite":
+        schema_editor.execute(SQLITE_SQL)
+    elif vendor == "postgresql":
+        for statement in POSTGRES_SQL:
+            schema_editor.execute(statement)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS forum_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0008_thread_reply_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
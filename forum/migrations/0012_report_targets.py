@@ -0,0 +1,100 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:12
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Q, Subquery
+
+
+def merge_duplicate_reports(apps, schema_editor):
+    Report = apps.get_model("forum", "Report")
+    ReportTarget = apps.get_model("forum", "ReportTarget")
+
+    # keep each user's earliest report per target, pending if any copy was
+    keys = ("target_type", "target_id", "reporter_id")
+    groups = (
+        Report.objects.values(*keys)
+        .annotate(
+            first=Min("id"),
+            copies=Count("id"),
+            pending=Count("id", filter=Q(status="pending")),
+        )
+        .filter(copies__gt=1)
+        .order_by()
+    )
+    for group in groups:
+        Report.objects.filter(**{k: group[k] for k in keys}).exclude(id=group["first"]).delete()
+        if group["pending"]:
+            Report.objects.filter(id=group["first"]).update(status="pending")
+
+    targets = (
+        Report.objects.values("target_type", "target_id")
+        .annotate(
+            last=Max("created_at"),
+            pending=Count("id", filter=Q(status="pending")),
+            total=Count("id"),
+        )
+        .order_by()
+    )
+    ReportTarget.objects.bulk_create(
+        [
+            ReportTarget(
+                target_type=row["target_type"],
+                target_id=row["target_id"],
+                status="pending" if row["pending"] else "resolved",
+                report_count=row["pending"] or row["total"],
+                last_reported_at=row["last"],
+            )
+            for row in targets
+        ],
+        batch_size=500,
+    )
+    # created_at is auto_now_add, so copy the first report's time afterwards
+    ReportTarget.objects.update(
+        created_at=Subquery(
+            Report.objects.filter(
+                target_type=OuterRef("target_type"), target_id=OuterRef("target_id")
+            )
+            .order_by("created_at")
+            .values("created_at")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0011_report_status_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportTarget',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target_type', models.CharField(choices=[('thread', 'Thread'), ('reply', 'Reply'), ('resource', 'Resource')], max_length=20)),
+                ('target_id', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('resolved', 'Resolved')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('last_reported_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(merge_duplicate_reports, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='report',
+            constraint=models.UniqueConstraint(fields=('target_type', 'target_id', 'reporter'), name='unique_reporter_target'),
+        ),
+        migrations.AddIndex(
+            model_name='reporttarget',
+            index=models.Index(fields=['status', '-report_count', '-last_reported_at'], name='forum_rtarget_volume_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reporttarget',
+            index=models.Index(fields=['status', '-created_at'], name='forum_rtarget_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='reporttarget',
+            constraint=models.UniqueConstraint(fields=('target_type', 'target_id'), name='unique_report_target'),
+        ),
+    ]
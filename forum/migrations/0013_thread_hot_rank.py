@@ -0,0 +1,44 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_all_stale(apps, schema_editor):
+    # existing threads get ranked by the next `manage.py rank_threads`
+    Thread = apps.get_model("forum", "Thread")
+    Thread.objects.update(rank_stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0012_report_targets'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='hot_rank',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='thread',
+            name='rank_stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_all_stale, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['-hot_rank', '-id'], name='forum_thread_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['category', '-hot_rank', '-id'], name='forum_thread_cat_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(condition=models.Q(('rank_stale', True)), fields=['id'], name='forum_thread_rank_stale_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('forum', '0014_thread_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['department', 'code'], name='forum_course_dept_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['course', 'resource_type', '-created_at', '-id'], name='forum_resource_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=models.Index(fields=['course', '-created_at', '-id'], name='forum_resource_course_idx'),
+        ),
+    ]
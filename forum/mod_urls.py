@@ -5,6 +5,9 @@ urlpatterns = [
     path("reply/<int:reply_id>/delete/", views.delete_reply, name="delete_reply"),
     path("thread/<int:thread_id>/lock/", views.lock_thread, name="lock_thread"),
     path("user/<int:user_id>/ban/", views.ban_user, name="ban_user"),
+    path("bulk/", views.bulk_moderation, name="bulk_moderation"),
     path("reports/", views.report_queue, name="report_queue"),
-    path("reports/<int:report_id>/resolve/", views.resolve_report, name="resolve_report"),
+    path("reports/archive/", views.report_archive, name="report_archive"),
+    path("reports/<str:target_type>/<int:target_id>/resolve/", views.resolve_report, name="resolve_report"),
+    path("performance/", views.performance_stats, name="performance_stats"),
 ]
\ No newline at end of file
@@ -1,6 +1,12 @@
 from django.db import models
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.utils import timezone
+
+from .pagination import CursorPaginator
+from .ranking import hot_rank
+from .rendering import RENDERER_VERSION, render_markdown
 
 
 class Course(models.Model):
@@ -8,6 +14,12 @@ class Course(models.Model):
     title = models.CharField(max_length=200)
     department = models.CharField(max_length=100)
 
+    class Meta:
+        indexes = [
+            # department pages list their courses by code
+            models.Index(fields=["department", "code"], name="forum_course_dept_idx"),
+        ]
+
     def __str__(self):
         return f"{self.code} - {self.title}"
 
@@ -34,6 +46,20 @@ class Resource(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # course pages, newest first, with and without a type filter;
+            # -id matches the cursor paginator's tie-breaker
+            models.Index(
+                fields=["course", "resource_type", "-created_at", "-id"],
+                name="forum_resource_type_idx",
+            ),
+            models.Index(
+                fields=["course", "-created_at", "-id"],
+                name="forum_resource_course_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.title
     
@@ -64,7 +90,82 @@ class Tag(models.Model):
         return self.name
     
 
-class Thread(models.Model):
+class RenderedContent(models.Model):
+    """
+    Markdown `content` plus its sanitized HTML, rendered once when the
+    content is written instead of on every page view.
+    """
+
+    content_html = models.TextField(blank=True, editable=False)
+    content_html_version = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def render_content(self):
+        self.content_html = render_markdown(self.content) #type: ignore
+        self.content_html_version = RENDERER_VERSION
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+
+        if update_fields is None or "content" in update_fields:
+            self.render_content()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "content_html", "content_html_version"}
+
+        super().save(*args, **kwargs)
+
+
+def user_vote_annotation(user, target):
+    """
+    The requesting user's vote (1, -1 or 0) on each row, as a correlated
+    subquery on Vote's (user, thread) / (user, reply) unique index.
+    """
+    if not user.is_authenticated:
+        return models.Value(0, output_field=models.SmallIntegerField())
+
+    votes = Vote.objects.filter(user=user, **{target: models.OuterRef("pk")})
+    return Coalesce(models.Subquery(votes.values("value")[:1]), 0)
+
+
+class ThreadQuerySet(models.QuerySet):
+    def with_user_vote(self, user):
+        return self.annotate(vote_value=user_vote_annotation(user, "thread"))
+
+    def with_subscription(self, user):
+        # None when the user doesn't follow the thread, else their digest flag
+        if not user.is_authenticated:
+            return self.annotate(subscription=models.Value(None, output_field=models.BooleanField()))
+        return self.annotate(
+            subscription=models.Subquery(
+                Subscription.objects.filter(user=user, thread=models.OuterRef("pk")).values("digest")[:1]
+            )
+        )
+
+    def for_listing(self):
+        # everything thread_list.html touches, in a fixed number of queries
+        return self.select_related("author", "category").prefetch_related(
+            models.Prefetch("tags", queryset=Tag.objects.only("id", "name", "slug"))
+        ).only(
+            "id",
+            "title",
+            "score",
+            "reply_count",
+            "hot_rank",
+            "created_at",
+            "updated_at",
+            "author__id",
+            "author__username",
+            "author__first_name",
+            "author__last_name",
+            "category__id",
+            "category__name",
+            "category__slug",
+        )
+
+
+class Thread(RenderedContent):
     title = models.CharField(max_length=200)
     content = models.TextField()
 
@@ -94,30 +195,63 @@ class Thread(models.Model):
 
     is_locked = models.BooleanField(default=False)
 
+    # denormalized from Vote, kept in sync by apply_vote_delta()
+    score = models.IntegerField(default=0)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+
+    # visible (not soft-deleted) replies, maintained by add_reply/delete_reply
+    reply_count = models.PositiveIntegerField(default=0)
+
+    # see ranking.py; whatever changes score or reply_count sets rank_stale
+    # and the rank_threads job recomputes hot_rank for those rows only
+    hot_rank = models.FloatField(default=0)
+    rank_stale = models.BooleanField(default=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ThreadQuerySet.as_manager()
+
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["-created_at"], name="forum_thread_created_idx"),
+            models.Index(
+                fields=["category", "-created_at"],
+                name="forum_thread_cat_created_idx",
+            ),
+            models.Index(fields=["-updated_at"], name="forum_thread_updated_idx"),
+            models.Index(fields=["-hot_rank", "-id"], name="forum_thread_hot_idx"),
+            models.Index(
+                fields=["category", "-hot_rank", "-id"],
+                name="forum_thread_cat_hot_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(rank_stale=True),
+                name="forum_thread_rank_stale_idx",
+            ),
+        ]
         permissions = [
             ("lock_thread", "Can lock threads"),
         ]
 
     def __str__(self):
         return self.title
-    
-    def score(self):
-        return self.votes.aggregate(total=models.Sum("value"))["total"] or 0 #type: ignore
-    
-    def user_vote(self, user):
-        if not user.is_authenticated:
-            return 0
-        
-        vote = self.votes.filter(user=user).first() #type: ignore
-        
-        return vote.value if vote else 0
-    
-class Reply(models.Model):
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.hot_rank = hot_rank(self.score, self.reply_count, timezone.now())
+        super().save(*args, **kwargs)
+
+
+class ReplyQuerySet(models.QuerySet):
+    def with_user_vote(self, user):
+        return self.annotate(vote_value=user_vote_annotation(user, "reply"))
+
+
+class Reply(RenderedContent):
     thread = models.ForeignKey(
         "Thread",
         on_delete=models.CASCADE,
@@ -134,27 +268,29 @@ class Reply(models.Model):
 
     is_deleted = models.BooleanField(default=False)
 
+    score = models.IntegerField(default=0)
+    upvote_count = models.PositiveIntegerField(default=0)
+    downvote_count = models.PositiveIntegerField(default=0)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ReplyQuerySet.as_manager()
+
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            models.Index(
+                fields=["thread", "created_at"],
+                name="forum_reply_thread_created_idx",
+            ),
+        ]
         permissions = [
             ("delete_any_reply", "Can delete any reply"),
         ]
 
     def __str__(self):
         return f"Reply by {self.author} on {self.thread}"
-    
-    def score(self):
-        return self.votes.aggregate(total=models.Sum("value"))["total"] or 0 #type: ignore
-    
-    def user_vote(self, user):
-        if not user.is_authenticated:
-            return 0
-        
-        vote = self.votes.filter(user=user).first() #type: ignore
-        return vote.value if vote else 0
 
 
 class Vote(models.Model):
@@ -205,8 +341,31 @@ class Vote(models.Model):
         ]
 
 
+def apply_vote_delta(model, obj_id, old_value=0, new_value=0):
+    """
+    Shift the cached score/up/down counters of a Thread or Reply by one vote
+    changing from old_value to new_value (0 meaning "no vote"), in a single
+    UPDATE so concurrent voters never overwrite each other.
+    """
+    if old_value == new_value:
+        return
+
+    up = int(new_value == Vote.UPVOTE) - int(old_value == Vote.UPVOTE)
+    down = int(new_value == Vote.DOWNVOTE) - int(old_value == Vote.DOWNVOTE)
 
-class Report(models.Model):
+    extra = {"rank_stale": True} if model is Thread else {}
+
+    # updated_at is the API's Last-Modified, and the score is in the payload
+    model.objects.filter(id=obj_id).update(
+        score=models.F("score") + (new_value - old_value),
+        upvote_count=models.F("upvote_count") + up,
+        downvote_count=models.F("downvote_count") + down,
+        updated_at=Now(),
+        **extra,
+    )
+
+
+class ReportedObject(models.Model):
     TARGET_CHOICES = [
         ("thread", "Thread"),
         ("reply", "Reply"),
@@ -218,12 +377,6 @@ class Report(models.Model):
         ("resolved", "Resolved"),
     ]
 
-    reporter = models.ForeignKey(
-        User,
-        on_delete=models.CASCADE,
-        related_name="reports"
-    )
-
     target_type = models.CharField(
         max_length=20,
         choices=TARGET_CHOICES
@@ -231,8 +384,6 @@ class Report(models.Model):
 
     target_id = models.PositiveIntegerField()
 
-    reason = models.TextField()
-
     status = models.CharField(
         max_length=10,
         choices=STATUS_CHOICES,
@@ -241,27 +392,236 @@ class Report(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
-    def __str__(self):
-        return f"Report #{self.id} ({self.target_type}:{self.target_id})" #type: ignore
-    
+    class Meta:
+        abstract = True
 
-    def get_target_url(self):
+    def get_target_url(self, replies=None):
+        """
+        `replies` is an optional {id: Reply} map (see reply_targets()) so a
+        whole page of reports can be resolved without a query per report.
+        """
         if self.target_type == "thread":
             return reverse("thread_detail", args=[self.target_id])
 
         if self.target_type == "reply":
             # reply belongs to a thread
-            from forum.models import Reply
-            reply = Reply.objects.filter(id=self.target_id).first()
+            if replies is None:
+                replies = Reply.objects.only("id", "thread_id", "created_at").in_bulk(
+                    [self.target_id]
+                )
+            reply = replies.get(self.target_id)
             if reply:
                 return (
-                    reverse("thread_detail", args=[reply.thread.id])
+                    reverse("thread_detail", args=[reply.thread_id]) #type: ignore
+                    + f"?cursor={CursorPaginator.cursor_ending_at(reply)}"
                     + f"#reply-{reply.id}" #type: ignore
                 )
 
         return "#"
 
+    @staticmethod
+    def reply_targets(reports):
+        # one query for every reply a page of reports points at
+        return Reply.objects.only("id", "thread_id", "created_at").filter(
+            id__in={r.target_id for r in reports if r.target_type == "reply"}
+        )
+
+
+class Report(ReportedObject):
+    """
+    One user's report on one target. Clicking report again updates the
+    existing row instead of adding another (see moderation.file_report).
+    """
+
+    reporter = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="reports"
+    )
+
+    reason = models.TextField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-created_at"],
+                name="forum_report_status_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["target_type", "target_id", "reporter"],
+                name="unique_reporter_target",
+            ),
+        ]
+
+    def __str__(self):
+        return f"Report #{self.id} ({self.target_type}:{self.target_id})" #type: ignore
+
+
+class ReportTarget(ReportedObject):
+    """
+    Everything reported about one thread / reply / resource, which is what
+    the moderation queue lists. report_count is the number of distinct
+    users with a pending report on it.
+    """
+
+    report_count = models.PositiveIntegerField(default=0)
+
+    last_reported_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "-report_count", "-last_reported_at"],
+                name="forum_rtarget_volume_idx",
+            ),
+            models.Index(
+                fields=["status", "-created_at"],
+                name="forum_rtarget_status_idx",
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["target_type", "target_id"],
+                name="unique_report_target",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.target_type}:{self.target_id} ({self.report_count} reports)"
+
+    def reports(self):
+        return Report.objects.filter(target_type=self.target_type, target_id=self.target_id)
 
 
+class Job(models.Model):
+    """
+    A side effect of a write, run later by `manage.py run_worker` (see
+    jobs.py). Finished rows are kept for a while as timing metrics.
+    """
 
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
 
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    # at most one queued job per key; later enqueues of the same work are dropped
+    unique_key = models.CharField(max_length=200, null=True, blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at", "id"], name="forum_job_ready_idx"),
+            models.Index(fields=["name", "-finished_at"], name="forum_job_metrics_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["unique_key"],
+                condition=models.Q(status="queued"),
+                name="unique_queued_job",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})" #type: ignore
+
+
+class JobLock(models.Model):
+    """
+    One row per named lock. Databases without SKIP LOCKED (SQLite) claim
+    jobs while holding the write lock taken by updating this row.
+    """
+
+    name = models.CharField(max_length=50, primary_key=True)
+    holder = models.CharField(max_length=100, blank=True)
+    acquired_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+
+class Subscription(models.Model):
+    """
+    A user following a thread. New replies notify them one by one, or with
+    digest=True are summed up by `manage.py send_digests`.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="subscriptions")
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="subscriptions")
+    digest = models.BooleanField(default=False)
+    # replies after this are in the user's next digest
+    last_digest_at = models.DateTimeField(default=timezone.now)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["thread", "digest"], name="forum_sub_thread_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "thread"], name="unique_subscription"),
+        ]
+
+    def __str__(self):
+        return f"{self.user} -> thread {self.thread_id}" #type: ignore
+
+
+class Notification(models.Model):
+    REPLY = "reply"
+    DIGEST = "digest"
+
+    KIND_CHOICES = [
+        (REPLY, "Reply"),
+        (DIGEST, "Digest"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="notifications")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=REPLY)
+
+    # REPLY: the reply and its thread. DIGEST: count replies, in one thread
+    # or (thread is None) several
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    reply = models.ForeignKey(Reply, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    count = models.PositiveIntegerField(default=1)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-id"], name="forum_notif_user_idx"),
+            models.Index(
+                fields=["user"],
+                condition=models.Q(read_at__isnull=True),
+                name="forum_notif_unread_idx",
+            ),
+        ]
+        constraints = [
+            # fan-out jobs may run twice
+            models.UniqueConstraint(fields=["user", "reply"], name="unique_reply_notification"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user}"
@@ -0,0 +1,182 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import jobs, live, metrics
+from .caching import bump_many, touch_threads
+from .db import retry_on_lock
+from .models import Reply, Report, ReportTarget, Thread
+
+
+# action -> permission needed to run it in bulk
+BULK_ACTIONS = {
+    "lock": "forum.lock_thread",
+    "delete": "forum.delete_any_reply",
+    "ban": "auth.change_user",
+    "resolve": "forum.delete_any_reply",
+}
+
+# a ban with purge_days also deletes replies and locks threads
+PURGE_PERMISSIONS = (BULK_ACTIONS["delete"], BULK_ACTIONS["lock"])
+
+
+@retry_on_lock()
+def file_report(user, target_type, target_id, reason):
+    """
+    Record that user reported a target. Reporting the same target again only
+    updates the reason, so the target's count is of distinct users. A target
+    that was resolved goes back to the queue when someone reports it again.
+    """
+    now = timezone.now()
+    target = {"target_type": target_type, "target_id": target_id}
+
+    with transaction.atomic():
+        Report.objects.bulk_create(
+            [Report(reporter=user, reason=reason, status="pending", **target)],
+            update_conflicts=True,
+            unique_fields=["target_type", "target_id", "reporter"],
+            update_fields=["reason", "status"],
+        )
+        ReportTarget.objects.bulk_create(
+            [ReportTarget(status="pending", last_reported_at=now, **target)],
+            update_conflicts=True,
+            unique_fields=["target_type", "target_id"],
+            update_fields=["status", "last_reported_at"],
+        )
+        # the upsert above holds the target row, so this count can't race
+        ReportTarget.objects.filter(**target).update(
+            report_count=Report.objects.filter(status="pending", **target).count()
+        )
+    metrics.inc("forum_created_total", kind="report")
+
+
+def resolve_target(target_type, target_id):
+    # closes every report on the target with one UPDATE per table
+    with transaction.atomic():
+        Report.objects.filter(
+            target_type=target_type, target_id=target_id, status="pending"
+        ).update(status="resolved")
+        return ReportTarget.objects.filter(
+            target_type=target_type, target_id=target_id, status="pending"
+        ).update(status="resolved")
+
+
+# bulk actions: one set-based UPDATE per table, however many ids are given.
+# Callers run these inside a transaction.
+
+def lock_threads(ids):
+    updated = Thread.objects.filter(id__in=ids, is_locked=False).update(
+        is_locked=True, updated_at=timezone.now()
+    )
+    bump_many("thread", ids)
+    touch_threads(ids)
+    for thread_id in ids:
+        live.publish(thread_id, "lock")
+    return updated
+
+
+def delete_replies(ids):
+    # lock the rows first so the reply counts below match what was deleted
+    rows = list(
+        Reply.objects.select_for_update()
+        .filter(id__in=ids, is_deleted=False)
+        .values_list("id", "thread_id")
+    )
+    if not rows:
+        return 0
+
+    reply_ids = [reply_id for reply_id, _ in rows]
+    per_thread = Counter(thread_id for _, thread_id in rows)
+
+    Reply.objects.filter(id__in=reply_ids).update(is_deleted=True, updated_at=timezone.now())
+    Thread.objects.filter(id__in=per_thread).update(
+        reply_count=F("reply_count") - Case(
+            *[When(id=thread_id, then=Value(n)) for thread_id, n in per_thread.items()],
+            default=Value(0),
+        ),
+        rank_stale=True,
+        updated_at=timezone.now(),
+    )
+
+    # .update() skips the post_save receivers, so do their work here, with
+    # the same jobs delete_reply queues
+    jobs.enqueue_many(
+        "search.sync",
+        [{"kind": "reply", "id": reply_id} for reply_id in reply_ids],
+        [f"search:reply:{reply_id}" for reply_id in reply_ids],
+    )
+    jobs.enqueue("rank_threads", unique_key="rank_threads")
+    bump_many("reply", reply_ids)
+    bump_many("thread", per_thread)
+    touch_threads(per_thread)
+    for reply_id, thread_id in rows:
+        live.publish(thread_id, "delete", id=reply_id)
+    return len(rows)
+
+
+def ban_users(ids, actor, purge_days=None):
+    """
+    Deactivate users and, with purge_days, soft-delete the replies they
+    posted in that many days and lock their threads from the same window
+    (threads have no soft delete).
+    """
+    users = User.objects.filter(id__in=ids, is_superuser=False).exclude(id=actor.id)
+    user_ids = list(users.values_list("id", flat=True))
+
+    summary = {
+        "banned": User.objects.filter(id__in=user_ids, is_active=True).update(is_active=False),
+    }
+
+    if purge_days:
+        since = timezone.now() - timedelta(days=purge_days)
+        summary["replies_deleted"] = delete_replies(
+            Reply.objects.filter(author_id__in=user_ids, created_at__gte=since)
+            .values_list("id", flat=True)
+        )
+        summary["threads_locked"] = lock_threads(
+            list(
+                Thread.objects.filter(author_id__in=user_ids, created_at__gte=since)
+                .values_list("id", flat=True)
+            )
+        )
+    return summary
+
+
+def resolve_targets(ids):
+    targets = ReportTarget.objects.filter(id__in=ids, status="pending")
+
+    by_type = {}
+    for target_type, target_id in targets.values_list("target_type", "target_id"):
+        by_type.setdefault(target_type, []).append(target_id)
+
+    for target_type, target_ids in by_type.items():
+        Report.objects.filter(
+            target_type=target_type, target_id__in=target_ids, status="pending"
+        ).update(status="resolved")
+
+    return targets.update(status="resolved")
+
+
+@retry_on_lock()
+def bulk_moderate(actor, action, ids, purge_days=None):
+    """
+    Run one BULK_ACTIONS action over a list of ids in a single transaction
+    and return a summary dict. Permissions are the caller's job.
+    """
+    with transaction.atomic():
+        if action == "lock":
+            summary = {"locked": lock_threads(ids)}
+        elif action == "delete":
+            summary = {"deleted": delete_replies(ids)}
+        elif action == "ban":
+            summary = ban_users(ids, actor, purge_days)
+        elif action == "resolve":
+            summary = {"resolved": resolve_targets(ids)}
+        else:
+            raise ValueError(f"Unknown moderation action {action!r}")
+
+    return {"action": action, "requested": len(ids), **summary}
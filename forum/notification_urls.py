@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path("", views.notification_list, name="notification_list"),
+    path("<int:notification_id>/", views.open_notification, name="open_notification"),
+    path("read/", views.mark_notifications_read, name="mark_notifications_read"),
+]
@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import caching, jobs
+from .models import Notification, Reply, Subscription
+
+
+# the badge count can lag a notification by at most this much when a
+# page view re-caches it while the fan-out is being written
+UNREAD_TIMEOUT = 60 * 5
+
+FAN_OUT_BATCH = 1000
+
+
+def _unread_key(user_id):
+    return f"forum:unread:{user_id}"
+
+
+def _unread_query(user):
+    return Notification.objects.filter(user=user, read_at__isnull=True)
+
+
+def unread_count(user):
+    """Unread notifications for the badge, counted once per change."""
+    cache = caching.get_cache()
+    key = _unread_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = _unread_query(user).count()
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+async def aunread_count(user):
+    cache = caching.get_cache()
+    key = _unread_key(user.id)
+    count = await cache.aget(key)
+    if count is None:
+        count = await _unread_query(user).acount()
+        await cache.aset(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def forget_unread(user_ids):
+    caching.get_cache().delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def mark_read(user, ids=None):
+    notifications = _unread_query(user)
+    if ids is not None:
+        notifications = notifications.filter(id__in=ids)
+    updated = notifications.update(read_at=timezone.now())
+    if updated:
+        forget_unread([user.id])
+    return updated
+
+
+def subscribe(user, thread_id, digest=False):
+    # a new or changed mode starts the digest window afresh, so replies
+    # already notified one by one are not summed up again
+    Subscription.objects.update_or_create(
+        user=user, thread_id=thread_id, defaults={"digest": digest, "last_digest_at": timezone.now()}
+    )
+
+
+def unsubscribe(user, thread_id):
+    Subscription.objects.filter(user=user, thread_id=thread_id).delete()
+
+
+@jobs.handler("notifications.fan_out")
+def fan_out(reply_id):
+    """
+    Notify everyone following the reply's thread (except its author and
+    digest subscribers) and subscribe the author. Runs on the job queue, so
+    a busy thread costs the poster nothing.
+    """
+    reply = (
+        Reply.objects.filter(id=reply_id, is_deleted=False)
+        .only("id", "thread_id", "author_id", "created_at")
+        .first()
+    )
+    if reply is None:
+        return
+
+    # repliers follow the thread from now on, with whatever mode they chose
+    Subscription.objects.bulk_create(
+        [Subscription(user_id=reply.author_id, thread_id=reply.thread_id)], #type: ignore
+        ignore_conflicts=True,
+    )
+
+    user_ids = list(
+        Subscription.objects.filter(thread_id=reply.thread_id, digest=False) #type: ignore
+        .exclude(user_id=reply.author_id) #type: ignore
+        .values_list("user_id", flat=True)
+    )
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                user_id=user_id,
+                kind=Notification.REPLY,
+                thread_id=reply.thread_id, #type: ignore
+                reply_id=reply.id, #type: ignore
+                actor_id=reply.author_id, #type: ignore
+                created_at=reply.created_at,
+            )
+            for user_id in user_ids
+        ],
+        batch_size=FAN_OUT_BATCH,
+        ignore_conflicts=True,
+    )
+    forget_unread(user_ids)
+
+
+def send_digests(now=None):
+    """
+    One notification per digest subscriber summing up the replies by others
+    in the threads they follow since their last digest. Returns the number
+    of notifications written.
+    """
+    now = now or timezone.now()
+
+    new_replies = Count(
+        "thread__replies",
+        filter=Q(
+            thread__replies__created_at__gt=F("last_digest_at"),
+            thread__replies__created_at__lte=now,
+            thread__replies__is_deleted=False,
+        )
+        & ~Q(thread__replies__author=F("user")),
+    )
+    rows = (
+        Subscription.objects.filter(digest=True, last_digest_at__lt=now)
+        .annotate(new=new_replies)
+        .filter(new__gt=0)
+        .values_list("user_id", "thread_id", "new")
+        .order_by()
+    )
+
+    per_user = defaultdict(dict)
+    for user_id, thread_id, new in rows:
+        per_user[user_id][thread_id] = new
+
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                user_id=user_id,
+                kind=Notification.DIGEST,
+                # link straight to the thread when there is only one
+                thread_id=next(iter(threads)) if len(threads) == 1 else None,
+                count=sum(threads.values()),
+                created_at=now,
+            )
+            for user_id, threads in per_user.items()
+        ],
+        batch_size=FAN_OUT_BATCH,
+    )
+    Subscription.objects.filter(digest=True, last_digest_at__lt=now).update(last_digest_at=now)
+    forget_unread(per_user)
+    return len(per_user)
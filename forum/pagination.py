@@ -0,0 +1,204 @@
+import base64
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+# ?page=N beyond this is treated as past the end; far larger numbers give
+# OFFSETs the database cannot even bind
+MAX_PAGE_NUMBER = 10_000
+
+
+def page_number(value):
+    """A ?page= parameter as a number from 1 to MAX_PAGE_NUMBER."""
+    try:
+        return min(max(int(value), 1), MAX_PAGE_NUMBER)
+    except (TypeError, ValueError):
+        return 1
+
+
+class CursorPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over (key, id), key being created_at unless given.
+
+    Pages are fetched with a range condition on the last/first row seen
+    instead of COUNT(*) + OFFSET, so deep pages cost the same as the first.
+    Cursors are opaque url-safe tokens; legacy ?page=N links still resolve
+    through get_page().
+    """
+
+    AFTER = "a"
+    BEFORE = "b"
+    UNTIL = "u"
+
+    def __init__(self, queryset, per_page, descending=False, key="created_at"):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.descending = descending
+        self.key = key
+
+    # tokens
+
+    @staticmethod
+    def encode_cursor(direction, obj, key="created_at"):
+        value = getattr(obj, key)
+        # repr() round-trips floats exactly, isoformat() does for datetimes
+        value = value.isoformat() if isinstance(value, datetime) else repr(value)
+        raw = f"{direction}|{value}|{obj.id}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+    @classmethod
+    def cursor_ending_at(cls, obj):
+        # the page whose last row is obj, e.g. to land on a freshly posted reply
+        return cls.encode_cursor(cls.UNTIL, obj)
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + "=" * (-len(token) % 4)
+            direction, value, pk = base64.urlsafe_b64decode(padded).decode().split("|")
+            field = self.queryset.model._meta.get_field(self.key)
+            return direction, field.to_python(value), int(pk)
+        except (ValueError, TypeError, UnicodeDecodeError, ValidationError):
+            return None
+
+    # queries
+
+    def _ordered(self, reverse=False):
+        desc = self.descending != reverse
+        prefix = "-" if desc else ""
+        return self.queryset.order_by(f"{prefix}{self.key}", f"{prefix}id")
+
+    def _beyond(self, value, pk, reverse=False):
+        # rows that come strictly after (value, pk) in the walk direction
+        lookup = "lt" if self.descending != reverse else "gt"
+        return Q(**{f"{self.key}__{lookup}": value}) | Q(
+            **{self.key: value, f"id__{lookup}": pk}
+        )
+
+    def _page(self, rows, has_more, has_before):
+        rows = rows[: self.per_page]
+        if not rows:
+            return CursorPage(rows)
+
+        return CursorPage(
+            rows,
+            next_cursor=self.encode_cursor(self.AFTER, rows[-1], self.key) if has_more else None,
+            previous_cursor=(
+                self.encode_cursor(self.BEFORE, rows[0], self.key) if has_before else None
+            ),
+        )
+
+    # Each lookup is planned as (rows queryset, optional "is there more"
+    # queryset, finish callback) so get_page() and aget_page() share the
+    # logic and only differ in how they run the queries.
+
+    def _plan_first(self):
+        def finish(rows, _):
+            return self._page(rows, len(rows) > self.per_page, False)
+
+        return self._ordered()[: self.per_page + 1], None, finish
+
+    def _plan_cursor(self, token):
+        decoded = self.decode_cursor(token)
+        if decoded is None:
+            return self._plan_first()
+
+        direction, value, pk = decoded
+
+        if direction == self.UNTIL:
+            beyond = self._beyond(value, pk)
+
+            def finish(rows, has_more):
+                has_before = len(rows) > self.per_page
+                return self._page(rows[: self.per_page][::-1], has_more, has_before)
+
+            return (
+                self._ordered(reverse=True).exclude(beyond)[: self.per_page + 1],
+                self._ordered().filter(beyond),
+                finish,
+            )
+
+        if direction == self.BEFORE:
+            def finish(rows, _):
+                has_before = len(rows) > self.per_page
+                return self._page(rows[: self.per_page][::-1], True, has_before)
+
+            qs = self._ordered(reverse=True).filter(self._beyond(value, pk, reverse=True))
+            return qs[: self.per_page + 1], None, finish
+
+        def finish(rows, _):
+            return self._page(rows, len(rows) > self.per_page, True)
+
+        qs = self._ordered().filter(self._beyond(value, pk))
+        return qs[: self.per_page + 1], None, finish
+
+    def _plan_number(self, number):
+        # old ?page=N bookmarks: one OFFSET query, no COUNT(*)
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        if number > MAX_PAGE_NUMBER:
+            return self._plan_first()
+
+        def finish(rows, _):
+            if not rows and number > 1:
+                return None  # past the end, fall back to the first page
+            return self._page(rows, len(rows) > self.per_page, number > 1)
+
+        offset = (number - 1) * self.per_page
+        return self._ordered()[offset : offset + self.per_page + 1], None, finish
+
+    def _plan(self, params):
+        cursor = params.get("cursor")
+        if cursor:
+            return self._plan_cursor(cursor)
+
+        page = params.get("page")
+        if page:
+            return self._plan_number(page)
+
+        return self._plan_first()
+
+    def get_page(self, params):
+        qs, more_qs, finish = self._plan(params)
+        page = finish(list(qs), more_qs is not None and more_qs.exists())
+        if page is None:
+            qs, _, finish = self._plan_first()
+            page = finish(list(qs), None)
+        return page
+
+    async def aget_page(self, params):
+        qs, more_qs, finish = self._plan(params)
+        rows = [row async for row in qs]
+        page = finish(rows, more_qs is not None and await more_qs.aexists())
+        if page is None:
+            qs, _, finish = self._plan_first()
+            page = finish([row async for row in qs], None)
+        return page
@@ -0,0 +1,174 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import OperationalError
+from django.template.backends.django import DjangoTemplates, Template
+
+from . import metrics
+from .db import is_lock_error
+
+
+logger = logging.getLogger(__name__)
+
+# requests over this many queries are logged, with the most repeated
+# statement, which is usually the N+1
+QUERY_BUDGET = getattr(settings, "FORUM_QUERY_BUDGET", 25)
+# samples kept per URL name for the percentiles on the staff page
+SAMPLES = getattr(settings, "FORUM_PERF_SAMPLES", 1000)
+
+
+class RequestStats:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.statements = Counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+
+# the stats of the request being handled; contextvars follow the request
+# into sync_to_async threads, so async views are measured too
+current = ContextVar("forum_request_stats", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """Connection execute wrapper, installed on every connection (see signals.py)."""
+    stats = current.get()
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    except OperationalError as exc:
+        # SQLite already waited out its busy timeout before giving up
+        if is_lock_error(exc):
+            metrics.inc("forum_db_lock_errors_total")
+        raise
+    finally:
+        if stats is not None:
+            stats.db_time += time.perf_counter() - start
+            stats.queries += 1
+            stats.statements[sql] += 1
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(context, request)
+
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose top-level renders count towards the request's template time."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+class Histogram:
+    """
+    The last SAMPLES requests per URL name, in this process only, for
+    percentiles on the staff performance page.
+    """
+
+    FIELDS = ("wall_ms", "queries", "db_ms", "template_ms", "size")
+
+    def __init__(self, size=SAMPLES):
+        self.size = size
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, name, sample):
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.size)
+            self.samples[name].append(sample)
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def summary(self):
+        with self.lock:
+            snapshot = {name: list(samples) for name, samples in self.samples.items()}
+
+        rows = []
+        for name, samples in sorted(snapshot.items()):
+            columns = dict(zip(self.FIELDS, zip(*samples)))
+            row = {"name": name, "count": len(samples)}
+            for field in ("wall_ms", "queries", "db_ms", "template_ms"):
+                for pct in (50, 95, 99):
+                    row[f"{field}_p{pct}"] = percentile(columns[field], pct)
+            sizes = [size for size in columns["size"] if size is not None]
+            row["size_avg"] = sum(sizes) / len(sizes) if sizes else None
+            rows.append(row)
+        return rows
+
+
+def percentile(samples, pct):
+    # nearest-rank on a non-empty sample; also used by jobs.py and loadtest
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+histogram = Histogram()
+
+
+def finish(request, response, stats):
+    """Record a finished request and return its Server-Timing header value."""
+    wall_ms = stats.elapsed * 1000
+    db_ms = stats.db_time * 1000
+    template_ms = stats.template_time * 1000
+    size = None if response.streaming else len(response.content)
+
+    match = getattr(request, "resolver_match", None)
+    name = (match and match.url_name) or "<unresolved>"
+    histogram.add(name, (wall_ms, stats.queries, db_ms, template_ms, size))
+    metrics.observe("forum_request_duration_seconds", stats.elapsed, view=name)
+    metrics.inc("forum_requests_total", view=name, status=f"{response.status_code // 100}xx")
+    metrics.inc("forum_db_queries_total", stats.queries, view=name)
+    metrics.inc("forum_db_query_seconds_total", stats.db_time, view=name)
+
+    if stats.queries > QUERY_BUDGET:
+        statement, repeats = stats.statements.most_common(1)[0]
+        logger.warning(
+            "%s %s ran %d queries (budget %d); most repeated, %d times: %s",
+            request.method,
+            request.path,
+            stats.queries,
+            QUERY_BUDGET,
+            repeats,
+            statement,
+            extra={"request": request},
+        )
+
+    timings = [
+        f"total;dur={wall_ms:.1f}",
+        f'db;dur={db_ms:.1f};desc="{stats.queries} queries"',
+        f"tpl;dur={template_ms:.1f}",
+    ]
+    if size is not None:
+        timings.append(f'size;desc="{size} bytes"')
+    return ", ".join(timings)
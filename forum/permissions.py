@@ -0,0 +1,111 @@
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission
+
+from . import caching
+
+
+def _generation():
+    # one number for every cached permission set; bumped by the signal
+    # receivers whenever groups or permissions change in the admin
+    return caching.get_versions("perms", ["all"])["all"]
+
+
+def invalidate():
+    caching.bump("perms", "all")
+
+
+def _perm_names(rows):
+    return {f"{app_label}.{codename}" for app_label, codename in rows}
+
+
+def group_permissions(group_ids, generation=None):
+    """
+    {group_id: {"app.codename", ...}} from the cache, loading the missing
+    groups in one query.
+    """
+    cache = caching.get_cache()
+    generation = generation or _generation()
+    keys = {f"forum:perms:{generation}:group:{gid}": gid for gid in group_ids}
+
+    found = {keys[key]: perms for key, perms in cache.get_many(keys).items()}
+    missing = [gid for gid in group_ids if gid not in found]
+    if missing:
+        loaded = {gid: set() for gid in missing}
+        rows = Permission.objects.filter(group__in=missing).values_list(
+            "group", "content_type__app_label", "codename"
+        ).order_by()
+        for gid, app_label, codename in rows:
+            loaded[gid].add(f"{app_label}.{codename}")
+        cache.set_many(
+            {f"forum:perms:{generation}:group:{gid}": perms for gid, perms in loaded.items()},
+            caching.FRAGMENT_TIMEOUT,
+        )
+        found.update(loaded)
+    return found
+
+
+def _user_entry(user, generation):
+    # (group ids, own permission names) for one user
+    cache = caching.get_cache()
+    key = f"forum:perms:{generation}:user:{user.id}"
+    entry = cache.get(key)
+    if entry is None:
+        entry = (
+            list(user.groups.values_list("id", flat=True)),
+            _perm_names(
+                user.user_permissions.values_list("content_type__app_label", "codename").order_by()
+            ),
+        )
+        cache.set(key, entry, caching.FRAGMENT_TIMEOUT)
+    return entry
+
+
+def user_group_names(user):
+    generation = _generation()
+    group_ids, _ = _user_entry(user, generation)
+    if not group_ids:
+        return set()
+
+    cache = caching.get_cache()
+    key = f"forum:perms:{generation}:group_names"
+    names = cache.get(key)
+    if names is None:
+        names = dict(Group.objects.values_list("id", "name"))
+        cache.set(key, names, caching.FRAGMENT_TIMEOUT)
+    return {names[gid] for gid in group_ids if gid in names}
+
+
+def user_permissions(user):
+    cache = caching.get_cache()
+    generation = _generation()
+
+    if user.is_superuser:
+        key = f"forum:perms:{generation}:all"
+        perms = cache.get(key)
+        if perms is None:
+            perms = _perm_names(
+                Permission.objects.values_list("content_type__app_label", "codename").order_by()
+            )
+            cache.set(key, perms, caching.FRAGMENT_TIMEOUT)
+        return perms
+
+    group_ids, own = _user_entry(user, generation)
+    perms = set(own)
+    for group_perms in group_permissions(group_ids, generation).values():
+        perms |= group_perms
+    return perms
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose permission sets come from the cache instead of two
+    queries per request. The set is still memoized on the user object, so
+    repeated perms.* checks in one request cost nothing.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            user_obj._perm_cache = user_permissions(user_obj)
+        return user_obj._perm_cache
@@ -0,0 +1,69 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .caching import bump_many
+
+
+# hot_rank = log10(activity) + age term, so ranks never need to decay over
+# time: a thread only has to be re-ranked when its own activity changes
+RANK_EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+
+# seconds of newness worth 10x the activity (12.5 hours)
+DECAY_SECONDS = 45000
+
+# a reply counts as much activity as this many net upvotes
+REPLY_WEIGHT = 2
+
+TOP_WINDOWS = {
+    "day": timedelta(days=1),
+    "week": timedelta(weeks=1),
+    "term": timedelta(weeks=18),
+}
+
+
+def hot_rank(score, reply_count, created_at):
+    activity = score + REPLY_WEIGHT * reply_count
+    order = math.log10(max(abs(activity), 1))
+    sign = (activity > 0) - (activity < 0)
+    age = (created_at - RANK_EPOCH).total_seconds()
+    return round(sign * order + age / DECAY_SECONDS, 7)
+
+
+def top_since(window):
+    return timezone.now() - TOP_WINDOWS[window]
+
+
+def rerank_stale(batch_size=500):
+    """
+    Recompute hot_rank for threads flagged rank_stale (new votes or
+    replies since the last run), one locked batch at a time. Returns the
+    number of threads re-ranked.
+    """
+    from .models import Thread
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            # the lock keeps a vote landing mid-batch from being marked
+            # fresh before it is counted
+            batch = list(
+                Thread.objects.select_for_update()
+                .filter(rank_stale=True)
+                .only("id", "score", "reply_count", "created_at")
+                .order_by("id")[:batch_size]
+            )
+            if not batch:
+                if total:
+                    # hot listings reorder
+                    bump_many("activity", ["all"])
+                return total
+
+            for thread in batch:
+                thread.hot_rank = hot_rank(thread.score, thread.reply_count, thread.created_at)
+                thread.rank_stale = False
+            Thread.objects.bulk_update(batch, ["hot_rank", "rank_stale"])
+
+        total += len(batch)
@@ -0,0 +1,36 @@
+import bleach
+import markdown
+
+
+# Bump whenever the extensions or the allowed-tag policy below change, then
+# run `manage.py rerender_content` to regenerate stored HTML.
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "sane_lists", "nl2br"]
+
+ALLOWED_TAGS = [
+    "a", "abbr", "b", "blockquote", "br", "code", "em", "h3", "h4", "h5", "h6",
+    "hr", "i", "li", "ol", "p", "pre", "strong", "ul",
+    "table", "thead", "tbody", "tr", "th", "td",
+]
+
+ALLOWED_ATTRIBUTES = {
+    "a": ["href", "title", "rel"],
+    "abbr": ["title"],
+    "th": ["align"],
+    "td": ["align"],
+}
+
+ALLOWED_PROTOCOLS = ["http", "https", "mailto"]
+
+
+def render_markdown(text):
+    html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS)
+    html = bleach.clean(
+        html,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
+    )
+    # also marks every link rel="nofollow"
+    return bleach.linkify(html)
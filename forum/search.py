@@ -0,0 +1,253 @@
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+from .models import Reply, Thread
+
+
+SEARCH_TABLE = "forum_search"
+
+# control characters survive escaping, so snippets are highlighted with
+# these first and turned into <mark> only after the text is escaped
+_OPEN, _CLOSE = "\x02", "\x03"
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_KINDS = {"thread": 0, "reply": 1}
+
+
+def doc_id(kind, object_id):
+    # rowid of an entry, so updates and deletes are primary-key lookups
+    return object_id * len(_KINDS) + _KINDS[kind]
+
+
+@dataclass
+class SearchHit:
+    kind: str
+    object_id: int
+    thread_id: int
+    rank: float
+    raw_snippet: str
+
+    @property
+    def snippet(self):
+        text = escape(self.raw_snippet)
+        return mark_safe(text.replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+class SearchBackend:
+    """
+    Keeps one row per thread / visible reply in the forum_search table
+    (created by migration 0009) and queries it.
+    """
+
+    def terms(self, query):
+        return _WORD_RE.findall(query.lower())[:16]
+
+    def index_thread(self, thread):
+        self._replace("thread", thread.id, thread.id, thread.title, thread.content)
+
+    def index_reply(self, reply):
+        if reply.is_deleted:
+            self.remove("reply", reply.id)
+            return
+        self._replace("reply", reply.id, reply.thread_id, "", reply.content)
+
+    def index_many(self, kind, rows):
+        # rows: iterable of (object_id, thread_id, title, body)
+        rows = list(rows)
+        if not rows:
+            return
+
+        ids = [doc_id(kind, row[0]) for row in rows]
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})",
+                ids,
+            )
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, kind, object_id, thread_id, title, body) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                [(pk, kind, *row) for pk, row in zip(ids, rows)],
+            )
+
+    def remove(self, kind, object_id):
+        self.remove_many(kind, [object_id])
+
+    def remove_many(self, kind, object_ids):
+        ids = [doc_id(kind, object_id) for object_id in object_ids]
+        if not ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(ids))})",
+                ids,
+            )
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+
+    def _replace(self, kind, object_id, thread_id, title, body):
+        self.index_many(kind, [(object_id, thread_id, title, body)])
+
+    def _filters(self, category=None, tag=None):
+        sql, params = [], []
+        if category:
+            sql.append(
+                f"{SEARCH_TABLE}.thread_id IN (SELECT t.id FROM forum_thread t "
+                "JOIN forum_category c ON c.id = t.category_id WHERE c.slug = %s)"
+            )
+            params.append(category)
+        if tag:
+            sql.append(
+                f"{SEARCH_TABLE}.thread_id IN (SELECT tt.thread_id FROM forum_thread_tags tt "
+                "JOIN forum_tag g ON g.id = tt.tag_id WHERE g.slug = %s)"
+            )
+            params.append(tag)
+        return "".join(f" AND {clause}" for clause in sql), params
+
+    def search(self, query, category=None, tag=None, limit=20, offset=0):
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    def match_expression(self, query):
+        terms = self.terms(query)
+        if not terms:
+            return None
+        # every term must appear; the last one is treated as a prefix
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    def search(self, query, category=None, tag=None, limit=20, offset=0):
+        match = self.match_expression(query)
+        if match is None:
+            return []
+
+        extra_sql, extra_params = self._filters(category, tag)
+
+        # bm25 weights follow column order: kind, object_id, thread_id, title, body
+        sql = (
+            "SELECT kind, object_id, thread_id, "
+            f"bm25({SEARCH_TABLE}, 0, 0, 0, 5.0, 1.0) AS rank, "
+            f"snippet({SEARCH_TABLE}, -1, %s, %s, '…', 16) "
+            f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+            f"{extra_sql} ORDER BY rank LIMIT %s OFFSET %s"
+        )
+        params = [_OPEN, _CLOSE, match, *extra_params, limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+class PostgresBackend(SearchBackend):
+    def search(self, query, category=None, tag=None, limit=20, offset=0):
+        terms = self.terms(query)
+        if not terms:
+            return []
+
+        extra_sql, extra_params = self._filters(category, tag)
+
+        sql = (
+            "SELECT kind, object_id, thread_id, "
+            "ts_rank_cd(document, q) AS rank, "
+            "ts_headline('english', title || ' ' || body, q, %s) "
+            f"FROM {SEARCH_TABLE}, websearch_to_tsquery('english', %s) q "
+            f"WHERE document @@ q{extra_sql} "
+            "ORDER BY rank DESC LIMIT %s OFFSET %s"
+        )
+        options = f"StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords=30, MinWords=10"
+        params = [options, " ".join(terms), *extra_params, limit, offset]
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [SearchHit(*row) for row in cursor.fetchall()]
+
+
+class SubstringBackend(SearchBackend):
+    """
+    Fallback for databases migration 0009 builds no index for (MySQL,
+    Oracle, ...): every term has to appear in the thread's title or text or
+    the reply's text, matched with icontains on the forum tables. Nothing
+    is indexed, so every search scans them; threads come before replies,
+    title matches first, then newest first.
+    """
+
+    def index_many(self, kind, rows):
+        pass
+
+    def remove_many(self, kind, object_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def snippet(self, terms, text, width=200):
+        pattern = re.compile("|".join(map(re.escape, terms)), re.IGNORECASE)
+        match = pattern.search(text)
+        start = max(match.start() - width // 4, 0) if match else 0
+        excerpt = ("…" if start else "") + text[start:start + width]
+        return pattern.sub(lambda m: f"{_OPEN}{m.group(0)}{_CLOSE}", excerpt)
+
+    def search(self, query, category=None, tag=None, limit=20, offset=0):
+        terms = self.terms(query)
+        if not terms:
+            return []
+
+        threads = Thread.objects.all()
+        replies = Reply.objects.filter(is_deleted=False)
+        if category:
+            threads = threads.filter(category__slug=category)
+            replies = replies.filter(thread__category__slug=category)
+        if tag:
+            threads = threads.filter(tags__slug=tag)
+            replies = replies.filter(thread__tags__slug=tag)
+
+        in_title = Q()
+        for term in terms:
+            threads = threads.filter(Q(title__icontains=term) | Q(content__icontains=term))
+            replies = replies.filter(content__icontains=term)
+            in_title &= Q(title__icontains=term)
+
+        end = offset + limit
+        thread_rows = (
+            threads.annotate(
+                title_match=Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField())
+            )
+            .order_by("title_match", "-created_at", "-id")
+            .values_list("id", "title", "content")[:end]
+        )
+        hits = [
+            SearchHit("thread", pk, pk, 0.0, self.snippet(terms, f"{title} {content}"))
+            for pk, title, content in thread_rows
+        ]
+        if len(hits) < end:
+            reply_rows = replies.order_by("-created_at", "-id").values_list("id", "thread_id", "content")
+            hits += [
+                SearchHit("reply", pk, thread_id, 0.0, self.snippet(terms, content))
+                for pk, thread_id, content in reply_rows[: end - len(hits)]
+            ]
+        return hits[offset:end]
+
+
+BACKENDS = {
+    "sqlite": SQLiteFTSBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend():
+    path = getattr(settings, "FORUM_SEARCH_BACKEND", None)
+    if path:
+        return import_string(path)()
+    return BACKENDS.get(connection.vendor, SubstringBackend)()
@@ -0,0 +1,136 @@
+from django.contrib.auth.models import Group, Permission, User
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import caching, jobs, metrics, performance, permissions
+from .models import Course, Reply, Resource, Thread, Vote
+
+
+# search index, updated by the job queue so posting doesn't wait on it
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+def index_thread(sender, instance, raw=False, **kwargs):
+    if not raw:
+        jobs.enqueue(
+            "search.sync",
+            {"kind": "thread", "id": instance.id},
+            unique_key=f"search:thread:{instance.id}",
+        )
+
+
+@receiver(post_save, sender=Reply)
+@receiver(post_delete, sender=Reply)
+def index_reply(sender, instance, raw=False, **kwargs):
+    # a soft-deleted reply is dropped from the index by the job
+    if not raw:
+        jobs.enqueue(
+            "search.sync",
+            {"kind": "reply", "id": instance.id},
+            unique_key=f"search:reply:{instance.id}",
+        )
+
+
+# rendered fragments; covers locking, soft deletes and edits made via save()
+
+@receiver(post_save, sender=Thread)
+@receiver(post_delete, sender=Thread)
+def invalidate_thread(sender, instance, **kwargs):
+    caching.bump("thread", instance.id)
+    caching.touch_threads([instance.id])
+
+
+@receiver(post_save, sender=Reply)
+@receiver(post_delete, sender=Reply)
+def invalidate_reply(sender, instance, **kwargs):
+    caching.bump("reply", instance.id)
+    caching.touch_threads([instance.thread_id])
+
+
+@receiver(m2m_changed, sender=Thread.tags.through)
+@receiver(m2m_changed, sender=Thread.resources.through)
+def invalidate_thread_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    thread_ids = list(pk_set or ()) if reverse else [instance.id]
+    if not thread_ids:
+        return
+    # tags and resources are part of the thread as the API serves it, so
+    # its Last-Modified (updated_at) and ETag (the version) move with them
+    Thread.objects.filter(id__in=thread_ids).update(updated_at=timezone.now())
+    caching.bump_many("thread", thread_ids)
+    caching.touch_threads(thread_ids)
+
+
+# course catalog pages; "all" covers the catalog and department listings,
+# which show resource counts
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course(sender, instance, **kwargs):
+    caching.bump_many("course", [instance.id, "all"])
+
+
+@receiver(post_save, sender=Resource)
+@receiver(post_delete, sender=Resource)
+def invalidate_resource(sender, instance, **kwargs):
+    caching.bump_many("course", [instance.course_id, "all"])
+
+
+@receiver(m2m_changed, sender=Thread.resources.through)
+def invalidate_course_threads(sender, instance, action, reverse, pk_set, **kwargs):
+    # a course page lists the threads attached to its resources
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        course_ids = {instance.course_id}
+    elif action == "pre_clear":
+        course_ids = set(instance.resources.values_list("course_id", flat=True))
+    else:
+        course_ids = set(
+            Resource.objects.filter(id__in=pk_set).values_list("course_id", flat=True)
+        )
+    caching.bump_many("course", course_ids)
+
+
+# cached permission sets; any admin change to groups or grants drops them all
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_permissions(sender, action, **kwargs):
+    if action.startswith("post_"):
+        permissions.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permissions_on_change(sender, **kwargs):
+    permissions.invalidate()
+
+
+# activity counters for /metrics, counted once the row is committed
+
+CREATED_KINDS = {Thread: "thread", Reply: "reply", Vote: "vote"}
+
+
+@receiver(post_save, sender=Thread)
+@receiver(post_save, sender=Reply)
+@receiver(post_save, sender=Vote)
+def count_created(sender, created, raw=False, **kwargs):
+    if created and not raw:
+        kind = CREATED_KINDS[sender]
+        transaction.on_commit(lambda: metrics.inc("forum_created_total", kind=kind))
+
+
+# per-request query counts for PerformanceMiddleware
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    performance.install(connection)
@@ -1,3 +1,1545 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import jobs, live, metrics, notifications, performance, permissions
+from .db import retry_on_lock
+from .middleware import GZipMiddleware
+from .models import (
+    Category, Course, Job, Notification, Reply, Resource, ReportTarget, Subscription, Tag, Thread, Vote,
+)
+from .moderation import file_report, resolve_target
+from .pagination import CursorPaginator
+from .rendering import RENDERER_VERSION
+from .throttling import check, consume, limit_for
+from .voting import toggle_vote
+
+
+class ForumTestCase(TestCase):
+    """
+    The fixture most tests start from: user "student" and a thread of theirs
+    in the Academics category. Extend setUpTestData() with super().
+    """
+
+    thread_content = "..."
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        cls.category = Category.objects.create(name="Academics", slug="academics")
+        cls.thread = Thread.objects.create(
+            title="Doubts", content=cls.thread_content, author=cls.user, category=cls.category
+        )
+
+
+class ThreadListBenchmarkTests(TestCase):
+    THREAD_COUNT = 3000
+    TAGS_PER_THREAD = 3
+
+    # session + user + MAX(updated_at) for the validators + page + tag
+    # prefetch; the unread badge and permission sets come from the cache
+    MAX_QUERIES = 5
+    LATENCY_BUDGET = 0.5  # seconds per page render
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        cls.authors = User.objects.bulk_create(
+            [User(username=f"author{i}", first_name="A", last_name=str(i)) for i in range(20)]
+        )
+        cls.categories = Category.objects.bulk_create(
+            [Category(name=f"Category {i}", slug=f"category-{i}") for i in range(5)]
+        )
+        cls.tags = Tag.objects.bulk_create(
+            [Tag(name=f"tag{i}", slug=f"tag{i}") for i in range(7)]
+        )
+
+        threads = Thread.objects.bulk_create(
+            [
+                Thread(
+                    title=f"Thread {i}",
+                    content="content " * 50,
+                    author=cls.authors[i % len(cls.authors)],
+                    category=cls.categories[i % len(cls.categories)],
+                )
+                for i in range(cls.THREAD_COUNT)
+            ]
+        )
+
+        Through = Thread.tags.through
+        Through.objects.bulk_create(
+            [
+                Through(thread_id=thread.id, tag_id=cls.tags[(i + j) % len(cls.tags)].id)
+                for i, thread in enumerate(threads)
+                for j in range(cls.TAGS_PER_THREAD)
+            ]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        # fill the per-user caches the first request of a process would,
+        # so the count doesn't depend on which test runs first
+        notifications.unread_count(self.user)
+        permissions.user_permissions(self.user)
+
+    def assert_bounded(self, params):
+        url = reverse("thread_list")
+
+        with CaptureQueriesContext(connection) as ctx:
+            start = time.perf_counter()
+            response = self.client.get(url, params)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(len(response.context["page_obj"]) > 0)
+        self.assertLessEqual(
+            len(ctx.captured_queries),
+            self.MAX_QUERIES,
+            "\n".join(q["sql"] for q in ctx.captured_queries),
+        )
+        self.assertLess(elapsed, self.LATENCY_BUDGET)
+        return response
+
+    def test_unfiltered_list(self):
+        self.assert_bounded({})
+
+    def test_deep_page(self):
+        self.assert_bounded({"page": 150})
+
+    def test_filtered_by_category(self):
+        response = self.assert_bounded({"category": "category-2"})
+        for thread in response.context["page_obj"]:
+            self.assertEqual(thread.category.slug, "category-2")
+
+    def test_filtered_by_tag(self):
+        response = self.assert_bounded({"tag": "tag4"})
+        for thread in response.context["page_obj"]:
+            self.assertIn("tag4", [t.slug for t in thread.tags.all()])
+
+
+class CursorPaginationTests(ForumTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # identical timestamps force the id tie-breaker
+        replies = Reply.objects.bulk_create(
+            [Reply(thread=cls.thread, author=cls.user, content=str(i)) for i in range(25)]
+        )
+        Reply.objects.filter(id__in=[r.id for r in replies[5:15]]).update(
+            created_at=replies[5].created_at
+        )
+        cls.expected = list(Reply.objects.order_by("created_at", "id").values_list("id", flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def get_page(self, params):
+        url = reverse("thread_detail", args=[self.thread.id])
+        return self.client.get(url, params).context["page_obj"]
+
+    def test_forward_and_back(self):
+        seen = []
+        pages = []
+        page = self.get_page({})
+        while True:
+            pages.append([r.id for r in page])
+            seen.extend(pages[-1])
+            if not page.has_next():
+                break
+            page = self.get_page({"cursor": page.next_cursor})
+
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+
+        back = self.get_page({"cursor": page.previous_cursor})
+        self.assertEqual([r.id for r in back], pages[1])
+        self.assertTrue(back.has_previous())
+
+    def test_legacy_page_number(self):
+        page = self.get_page({"page": 2})
+        self.assertEqual([r.id for r in page], self.expected[10:20])
+        self.assertTrue(page.has_previous())
+        self.assertTrue(page.has_next())
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = self.get_page({"cursor": "not-a-cursor"})
+        self.assertEqual([r.id for r in page], self.expected[:10])
+
+    def test_huge_page_numbers_fall_back_to_first_page(self):
+        page = self.get_page({"page": "99999999999999999999"})
+        self.assertEqual([r.id for r in page], self.expected[:10])
+
+        response = self.client.get(reverse("search"), {"q": "doubts", "page": "99999999999999999999"})
+        self.assertEqual(response.status_code, 200)
+
+
+class ReplyCountTests(ForumTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Reply.objects.bulk_create(
+            [Reply(thread=cls.thread, author=cls.user, content=str(i)) for i in range(23)]
+        )
+        Thread.objects.filter(id=cls.thread.id).update(reply_count=23)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_add_reply_redirects_to_new_reply_without_counting(self):
+        url = reverse("add_reply", args=[self.thread.id])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {"content": "answer"})
+
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+        reply = Reply.objects.latest("id")
+        self.assertTrue(response["Location"].endswith(f"#reply-{reply.id}"))
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 24)
+
+        page = self.client.get(response["Location"]).context["page_obj"]
+        self.assertEqual(page[len(page) - 1].id, reply.id)
+        self.assertTrue(page.has_previous())
+        self.assertFalse(page.has_next())
+
+    def test_soft_delete_decrements_once(self):
+        reply = Reply.objects.first()
+        url = reverse("delete_reply", args=[reply.id])
+
+        self.client.post(url)
+        self.client.post(url)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 22)
+
+    def test_concurrent_deletes_decrement_once(self):
+        # both requests loaded the reply before either deleted it
+        stale = Reply.objects.first()
+        url = reverse("delete_reply", args=[stale.id])
+
+        with mock.patch("forum.views.get_object_or_404", return_value=stale):
+            self.client.post(url)
+            self.client.post(url)
+
+        self.thread.refresh_from_db()
+        self.assertEqual(self.thread.reply_count, 22)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        academics = Category.objects.create(name="Academics", slug="academics")
+        campus = Category.objects.create(name="Campus Life", slug="campus-life")
+        cls.pyp = Tag.objects.create(name="pyp", slug="pyp")
+
+        cls.exam = Thread.objects.create(
+            title="CS F111 previous year papers",
+            content="Does anyone have the compre papers?",
+            author=cls.user,
+            category=academics,
+        )
+        cls.exam.tags.add(cls.pyp)
+        cls.mess = Thread.objects.create(
+            title="Mess food",
+            content="The papers in the mess say <b>paneer</b> tonight",
+            author=cls.user,
+            category=campus,
+        )
+        cls.reply = Reply.objects.create(
+            thread=cls.exam, author=cls.user, content="Check the library archive for papers"
+        )
+        Thread.objects.filter(id=cls.exam.id).update(reply_count=1)
+        jobs.run_pending()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, **params):
+        response = self.client.get(reverse("search"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context["results"]
+
+    def test_title_match_ranks_first(self):
+        results = self.search(q="papers")
+        self.assertEqual(len(results), 3)
+        self.assertEqual((results[0].kind, results[0].object_id), ("thread", self.exam.id))
+
+    def test_filters(self):
+        self.assertEqual({h.thread_id for h in self.search(q="papers", category="campus-life")}, {self.mess.id})
+        self.assertEqual({h.thread_id for h in self.search(q="papers", tag="pyp")}, {self.exam.id})
+
+    def test_other_databases_fall_back_to_substring_search(self):
+        with mock.patch.object(connection, "vendor", "mysql"):
+            results = self.search(q="papers")
+            filtered = self.search(q="papers", tag="pyp")
+            escaped = self.search(q="paneer")
+
+        self.assertEqual(
+            [(h.kind, h.object_id) for h in results],
+            [("thread", self.exam.id), ("thread", self.mess.id), ("reply", self.reply.id)],
+        )
+        self.assertEqual({h.thread_id for h in filtered}, {self.exam.id})
+        self.assertIn("&lt;b&gt;<mark>paneer</mark>", escaped[0].snippet)
+
+    def test_prefix_and_snippet_are_escaped(self):
+        results = self.search(q="pane")
+        self.assertEqual(len(results), 1)
+        self.assertIn("&lt;b&gt;<mark>paneer</mark>", results[0].snippet)
+
+    def test_soft_deleted_reply_leaves_index(self):
+        self.assertIn(self.reply.id, [h.object_id for h in self.search(q="library")])
+        self.client.post(reverse("delete_reply", args=[self.reply.id]))
+        jobs.run_pending()
+        self.assertEqual(self.search(q="library"), [])
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(self.search(q='"unbalanced AND ('), [])
+
+
+class FragmentCacheTests(ForumTestCase):
+    thread_content = "thread body"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user("other", password="pass")
+        cls.reply = Reply.objects.create(thread=cls.thread, author=cls.user, content="first")
+        Thread.objects.filter(id=cls.thread.id).update(reply_count=1)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse("thread_detail", args=[self.thread.id])
+
+    def test_reply_fragment_is_reused(self):
+        self.client.get(self.url)
+        Reply.objects.filter(id=self.reply.id).update(content="changed behind the cache")
+
+        self.assertContains(self.client.get(self.url), "first")
+
+    def test_soft_delete_invalidates_reply(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("delete_reply", args=[self.reply.id]))
+
+        self.assertContains(self.client.get(self.url), "This reply was removed.")
+
+    def test_vote_invalidates_thread_card(self):
+        list_url = reverse("thread_list")
+        self.assertContains(self.client.get(list_url), "0 points")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("vote", args=["thread", self.thread.id, "up"]))
+
+        self.assertContains(self.client.get(list_url), "1 point")
+
+    def test_rebuilt_vote_counts_invalidate_cached_scores(self):
+        list_url = reverse("thread_list")
+        self.assertContains(self.client.get(list_url), "0 points")
+        self.client.get(self.url)
+        # votes that never reached the counters
+        Vote.objects.bulk_create(
+            [Vote(user=self.other, thread=self.thread, value=1), Vote(user=self.other, reply=self.reply, value=1)]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("rebuild_vote_counts", stdout=StringIO())
+
+        self.assertContains(self.client.get(list_url), "1 point")
+        self.assertContains(self.client.get(self.url), f'id="score-reply-{self.reply.id}">1<')
+
+    def test_vote_highlight_is_per_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("vote", args=["reply", self.reply.id, "up"]))
+        self.assertContains(self.client.get(self.url), "vote-btn upvoted")
+
+        self.client.force_login(self.other)
+        self.assertNotContains(self.client.get(self.url), "vote-btn upvoted")
+
+
+class RenderedContentTests(ForumTestCase):
+    def test_markdown_is_rendered_and_sanitized_on_save(self):
+        thread = Thread.objects.create(
+            title="t",
+            content="**bold** <script>alert(1)</script> [x](javascript:alert(1))",
+            author=self.user,
+            category=self.category,
+        )
+
+        self.assertIn("<strong>bold</strong>", thread.content_html)
+        self.assertIn("&lt;script&gt;", thread.content_html)
+        self.assertNotIn("javascript:", thread.content_html)
+        self.assertEqual(thread.content_html_version, RENDERER_VERSION)
+
+    def test_rerender_content_catches_up_stale_rows(self):
+        Thread.objects.bulk_create(
+            [Thread(title=str(i), content=f"*{i}*", author=self.user, category=self.category) for i in range(7)]
+        )
+
+        call_command("rerender_content", batch_size=3, stdout=StringIO())
+
+        self.assertFalse(Thread.objects.filter(content_html_version__lt=RENDERER_VERSION).exists())
+        self.assertEqual(Thread.objects.get(title="3").content_html, "<p><em>3</em></p>")
+
+
+class ThreadDetailQueryTests(ForumTestCase):
+    # session + user + page validators + thread + replies + auth perms
+    # + resources (cold fragment) + unread badge (cold)
+    MAX_QUERIES = 9
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        voters = User.objects.bulk_create([User(username=f"voter{i}") for i in range(20)])
+        replies = Reply.objects.bulk_create(
+            [Reply(thread=cls.thread, author=voters[i], content=str(i)) for i in range(10)]
+        )
+        Vote.objects.bulk_create(
+            [Vote(user=voter, reply=reply, value=1) for voter in voters for reply in replies]
+            + [Vote(user=voter, thread=cls.thread, value=-1) for voter in voters]
+        )
+        Vote.objects.create(user=cls.user, thread=cls.thread, value=1)
+        Vote.objects.create(user=cls.user, reply=replies[3], value=-1)
+        cls.replies = replies
+        call_command("rebuild_vote_counts", stdout=StringIO())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_scores_and_votes_in_constant_queries(self):
+        url = reverse("thread_detail", args=[self.thread.id])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+
+        self.assertLessEqual(len(ctx.captured_queries), self.MAX_QUERIES)
+
+        thread = response.context["thread"]
+        self.assertEqual((thread.score, thread.vote_value), (-19, 1))
+
+        page = {reply.id: reply for reply in response.context["page_obj"]}
+        self.assertEqual(page[self.replies[3].id].vote_value, -1)
+        self.assertEqual(page[self.replies[3].id].score, 19)
+        self.assertEqual(page[self.replies[0].id].vote_value, 0)
+        self.assertEqual(page[self.replies[0].id].score, 20)
+
+
+class ReportQueueTests(TestCase):
+    # session + user + perms + targets + reply targets + reports with reporters
+    # + unread badge (cold)
+    MAX_QUERIES = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user("mod", password="pass")
+        cls.moderator.user_permissions.add(
+            Permission.objects.get(codename="delete_any_reply")
+        )
+        reporters = User.objects.bulk_create([User(username=f"r{i}") for i in range(10)])
+        category = Category.objects.create(name="Academics", slug="academics")
+        thread = Thread.objects.create(
+            title="Doubts", content="...", author=cls.moderator, category=category
+        )
+        replies = Reply.objects.bulk_create(
+            [Reply(thread=thread, author=cls.moderator, content=str(i)) for i in range(10)]
+        )
+        cls.thread, cls.replies = thread, replies
+        cls.reporters = reporters
+        for i, (reporter, reply) in enumerate(zip(reporters, replies)):
+            # reply i is reported by i + 1 users
+            for other in reporters[:i + 1]:
+                file_report(other, "reply", reply.id, "spam")
+        file_report(reporters[0], "thread", thread.id, "off topic")
+        resolve_target("thread", thread.id)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.moderator)
+
+    def test_pending_queue_in_constant_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("report_queue"))
+
+        self.assertLessEqual(len(ctx.captured_queries), self.MAX_QUERIES)
+
+        page = response.context["targets"]
+        self.assertEqual(len(page), 10)
+        self.assertTrue(all(target.status == "pending" for target in page))
+        # sorted by volume
+        self.assertEqual([t.report_count for t in page], list(range(10, 0, -1)))
+        # only the latest few reasons per target are loaded
+        self.assertEqual(len(page[0].pending_reports), 3)
+        self.assertEqual(page[0].pending_reports[0].reporter, self.reporters[9])
+        self.assertTrue(
+            all(target.target_url.startswith(f"/threads/{self.thread.id}/") for target in page)
+        )
+        self.assertIn(f"#reply-{self.replies[0].id}", page[-1].target_url)
+
+    def test_reports_are_matched_by_target_type(self):
+        reply = self.replies[0]
+        file_report(self.reporters[0], "thread", reply.id, "wrong target")
+
+        response = self.client.get(reverse("report_queue"))
+        targets = {(t.target_type, t.target_id): t for t in response.context["targets"]}
+        self.assertEqual(
+            [r.reason for r in targets["reply", reply.id].pending_reports], ["spam"]
+        )
+        self.assertEqual(
+            [r.reason for r in targets["thread", reply.id].pending_reports], ["wrong target"]
+        )
+
+    def test_repeat_reports_are_deduplicated(self):
+        reply = self.replies[0]
+        for _ in range(3):
+            file_report(self.reporters[0], "reply", reply.id, "still spam")
+        file_report(self.reporters[5], "reply", reply.id, "spam")
+
+        target = ReportTarget.objects.get(target_type="reply", target_id=reply.id)
+        self.assertEqual(target.report_count, 2)
+        self.assertEqual(target.reports().count(), 2)
+
+    def test_resolving_closes_every_report_on_target(self):
+        reply = self.replies[9]
+        response = self.client.post(reverse("resolve_report", args=["reply", reply.id]))
+        self.assertEqual(response.status_code, 302)
+
+        target = ReportTarget.objects.get(target_type="reply", target_id=reply.id)
+        self.assertEqual(target.status, "resolved")
+        self.assertFalse(target.reports().filter(status="pending").exists())
+
+        # a new report reopens it
+        file_report(self.reporters[0], "reply", reply.id, "back again")
+        target.refresh_from_db()
+        self.assertEqual((target.status, target.report_count), ("pending", 1))
+
+    def test_resolved_reports_only_in_archive(self):
+        response = self.client.get(reverse("report_queue"))
+        self.assertNotContains(response, "off topic")
+
+        response = self.client.get(reverse("report_archive"))
+        page = list(response.context["page_obj"])
+        self.assertEqual([(t.target_type, t.target_id) for t in page], [("thread", self.thread.id)])
+
+
+class BulkModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderator = User.objects.create_user("mod", password="pass")
+        cls.moderator.user_permissions.add(
+            *Permission.objects.filter(codename__in=["delete_any_reply", "lock_thread", "change_user"])
+        )
+        cls.spammer = User.objects.create_user("spammer", password="pass")
+        category = Category.objects.create(name="Academics", slug="academics")
+        cls.threads = [
+            Thread.objects.create(
+                title=f"T{i}", content="...", author=cls.moderator, category=category,
+                reply_count=25,
+            )
+            for i in range(2)
+        ]
+        cls.replies = Reply.objects.bulk_create(
+            [Reply(thread=cls.threads[i % 2], author=cls.spammer, content="buy now")
+             for i in range(50)]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.moderator)
+
+    def post(self, **data):
+        return self.client.post(reverse("bulk_moderation"), data)
+
+    def test_delete_is_set_based(self):
+        ids = ",".join(str(reply.id) for reply in self.replies)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.post(action="delete", ids=ids)
+
+        self.assertEqual(response.json()["deleted"], 50)
+        # the same handful of statements whatever the number of ids
+        self.assertLess(len(ctx.captured_queries), 15)
+        self.assertEqual(
+            [t.reply_count for t in Thread.objects.filter(id__in=[t.id for t in self.threads])],
+            [0, 0],
+        )
+
+        # deleting again changes nothing
+        response = self.post(action="delete", ids=ids)
+        self.assertEqual(response.json()["deleted"], 0)
+
+    def test_delete_queues_the_same_jobs_as_single_deletes(self):
+        Job.objects.all().delete()
+        self.post(action="delete", ids=",".join(str(reply.id) for reply in self.replies[:3]))
+
+        self.assertEqual(
+            sorted(Job.objects.values_list("name", "unique_key")),
+            [("rank_threads", "rank_threads")]
+            + sorted(("search.sync", f"search:reply:{reply.id}") for reply in self.replies[:3]),
+        )
+
+    def test_ban_with_purge(self):
+        response = self.post(action="ban", ids=[self.spammer.id, self.moderator.id], purge_days=7)
+
+        self.assertEqual(
+            response.json(),
+            {"action": "ban", "requested": 2, "banned": 1, "replies_deleted": 50, "threads_locked": 0},
+        )
+        self.spammer.refresh_from_db()
+        self.assertFalse(self.spammer.is_active)
+        self.assertFalse(Reply.objects.filter(is_deleted=False).exists())
+
+    def test_purge_needs_delete_and_lock_permissions(self):
+        banner = User.objects.create_user("banner", password="pass")
+        banner.user_permissions.add(Permission.objects.get(codename="change_user"))
+        self.client.force_login(banner)
+
+        response = self.post(action="ban", ids=self.spammer.id, purge_days=7)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Reply.objects.filter(is_deleted=True).exists())
+
+        response = self.post(action="ban", ids=self.spammer.id)
+        self.assertEqual(response.json()["banned"], 1)
+
+    def test_single_permission_check(self):
+        self.client.force_login(self.spammer)
+        response = self.post(action="lock", ids=self.threads[0].id)
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Thread.objects.filter(is_locked=True).exists())
+
+        self.client.force_login(self.moderator)
+        response = self.post(action="lock", ids=[t.id for t in self.threads])
+        self.assertEqual(response.json()["locked"], 2)
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.post(action="nuke", ids="1").status_code, 400)
+        self.assertEqual(self.post(action="lock", ids="a,b").status_code, 400)
+        self.assertEqual(self.post(action="lock").status_code, 400)
+
+
+class PermissionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.moderators = Group.objects.create(name="Moderators")
+        cls.moderators.permissions.add(Permission.objects.get(codename="lock_thread"))
+        cls.user = User.objects.create_user("mod", password="pass")
+        cls.user.groups.add(cls.moderators)
+
+    def setUp(self):
+        cache.clear()
+
+    def fresh_user(self):
+        # a new object per "request", like the auth middleware gives us
+        return User.objects.get(id=self.user.id)
+
+    def test_warm_checks_cost_no_queries(self):
+        self.assertTrue(self.fresh_user().has_perm("forum.lock_thread"))
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("forum.lock_thread"))
+            self.assertFalse(user.has_perm("forum.delete_any_reply"))
+            self.assertTrue(user.has_perm("forum.lock_thread"))
+
+    def test_group_changes_invalidate(self):
+        self.assertFalse(self.fresh_user().has_perm("forum.delete_any_reply"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.moderators.permissions.add(Permission.objects.get(codename="delete_any_reply"))
+        self.assertTrue(self.fresh_user().has_perm("forum.delete_any_reply"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.remove(self.moderators)
+        self.assertFalse(self.fresh_user().has_perm("forum.lock_thread"))
+
+
+class HotRankingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        voters = User.objects.bulk_create([User(username=f"voter{i}") for i in range(10)])
+        category = Category.objects.create(name="Academics", slug="academics")
+        cls.threads = [
+            Thread.objects.create(title=f"T{i}", content="...", author=cls.user, category=category)
+            for i in range(5)
+        ]
+        # the oldest thread is the popular one
+        for voter in voters:
+            toggle_vote(voter, cls.threads[0], 1)
+        # and one thread is too old for the weekly top list
+        Thread.objects.filter(id=cls.threads[1].id).update(
+            created_at=timezone.now() - timedelta(days=30)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_only_threads_with_activity_are_reranked(self):
+        self.assertEqual(list(Thread.objects.filter(rank_stale=True)), [self.threads[0]])
+
+        out = StringIO()
+        call_command("rank_threads", stdout=out)
+        self.assertIn("Re-ranked 1 threads", out.getvalue())
+        self.assertFalse(Thread.objects.filter(rank_stale=True).exists())
+
+        call_command("rank_threads", stdout=out)
+        self.assertIn("Re-ranked 0 threads", out.getvalue())
+
+    def test_hot_sort(self):
+        call_command("rank_threads", stdout=StringIO())
+
+        response = self.client.get(reverse("thread_list"), {"sort": "hot"})
+        page = list(response.context["page_obj"])
+        self.assertEqual(page[0], self.threads[0])
+
+        plan = str(Thread.objects.order_by("-hot_rank", "-id")[:15].explain())
+        if connection.vendor == "sqlite":
+            self.assertIn("forum_thread_hot_idx", plan)
+
+    def test_top_sort_respects_window(self):
+        response = self.client.get(reverse("thread_list"), {"sort": "top", "t": "week"})
+        page = list(response.context["page_obj"])
+        self.assertEqual(page[0], self.threads[0])
+        self.assertNotIn(self.threads[1], page)
+
+        response = self.client.get(reverse("thread_list"), {"sort": "top", "t": "term"})
+        self.assertIn(self.threads[1], list(response.context["page_obj"]))
+
+
+class RecordingBroker:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, thread_id, message):
+        self.published.append((thread_id, message))
+
+
+class LiveUpdateTests(ForumTestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+        patcher = mock.patch("forum.live.ENABLED", True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def read(self, stream):
+        return (await asyncio.wait_for(anext(stream), 2)).decode()
+
+    async def test_stream_delivers_events_and_frees_slot(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("thread_events", args=[self.thread.id]))
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await self.read(stream), "retry: 5000\n\n")
+
+        # published from another thread, as sync views do
+        message = live.format_event("score", {"kind": "thread", "id": self.thread.id, "score": 3})
+        await asyncio.to_thread(live.get_broker().publish, self.thread.id, message)
+        self.assertEqual(await self.read(stream), message)
+
+        self.assertEqual(live.limiter.by_user[self.user.id], 1)
+        await asyncio.to_thread(response.close)
+        self.assertNotIn(self.user.id, live.limiter.by_user)
+        self.assertFalse(live.get_broker().subscriptions.get(self.thread.id))
+
+    async def test_connection_cap(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse("thread_events", args=[self.thread.id])
+        responses = []
+        try:
+            for _ in range(live.limiter.per_user):
+                responses.append(await self.async_client.get(url))
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response["Retry-After"], "30")
+        finally:
+            for response in responses:
+                await asyncio.to_thread(response.close)
+
+    def test_wsgi_requests_are_not_streamed(self):
+        url = reverse("thread_events", args=[self.thread.id])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(response.streaming)
+        self.assertNotIn(self.user.id, live.limiter.by_user)
+        self.assertContains(self.client.get(reverse("thread_detail", args=[self.thread.id])), url)
+
+    async def test_disabled_by_default(self):
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("forum.live.ENABLED", False):
+            response = await self.async_client.get(reverse("thread_events", args=[self.thread.id]))
+            page = await self.async_client.get(reverse("thread_detail", args=[self.thread.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertNotContains(page, "EventSource")
+
+    def test_writes_publish_after_commit(self):
+        broker, live._broker = live._broker, RecordingBroker()
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("add_reply", args=[self.thread.id]), {"content": "hi"})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse("vote", args=["thread", self.thread.id, "up"]))
+
+            events = [message.split("\n")[0] for _, message in live._broker.published]
+            self.assertEqual(events, ["event: reply", "event: score"])
+            self.assertIn('"score": 1', live._broker.published[1][1])
+        finally:
+            live._broker = broker
+
+
+class ApiTests(ForumTestCase):
+    thread_content = "**bold**"
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Reply.objects.bulk_create(
+            [Reply(thread=cls.thread, author=cls.user, content=str(i)) for i in range(30)]
+        )
+        cls.course = Course.objects.create(code="CS F111", title="Computer Programming", department="CS")
+        Resource.objects.create(course=cls.course, title="Slides", resource_type="pdf", link="https://example.com/a.pdf")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_thread_detail_revalidates_with_304(self):
+        url = reverse("api_thread_detail", args=[self.thread.id])
+        response = self.client.get(url)
+        self.assertEqual(response.json()["content_html"], "<p><strong>bold</strong></p>")
+        etag = response["ETag"]
+        self.assertTrue(etag.startswith('"'))
+        self.assertIn("Last-Modified", response)
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b"")
+        # no tag / resource prefetches on the 304 path
+        self.assertFalse(any("forum_tag" in q["sql"] for q in ctx.captured_queries))
+
+        toggle_vote(self.user, self.thread, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["score"], 1)
+
+    def test_tag_and_resource_changes_invalidate(self):
+        cache.clear()
+        Thread.objects.filter(id=self.thread.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        tag = Tag.objects.create(name="Exams", slug="exams")
+        resource = Resource.objects.first()
+        detail_url = reverse("api_thread_detail", args=[self.thread.id])
+        list_url = reverse("api_thread_list")
+        detail = self.client.get(detail_url)
+        listing = self.client.get(list_url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.thread.tags.add(tag)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(response.json()["tags"], ["exams"])
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=detail["Last-Modified"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_NONE_MATCH=listing["ETag"]).status_code, 200)
+
+        detail = self.client.get(detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            resource.threads.add(self.thread)
+        response = self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual([r["id"] for r in response.json()["resources"]], [resource.id])
+
+    def test_votes_and_replies_move_last_modified(self):
+        detail_url = reverse("api_thread_detail", args=[self.thread.id])
+        list_url = reverse("api_thread_list")
+        Thread.objects.filter(id=self.thread.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        since = self.client.get(detail_url)["Last-Modified"]
+        self.assertEqual(self.client.get(list_url, HTTP_IF_MODIFIED_SINCE=since).status_code, 304)
+
+        toggle_vote(self.user, self.thread, 1)
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.json()["score"], 1)
+        self.assertEqual(self.client.get(list_url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        Thread.objects.filter(id=self.thread.id).update(updated_at=timezone.now() - timedelta(hours=1))
+        since = self.client.get(detail_url)["Last-Modified"]
+        self.client.post(reverse("add_reply", args=[self.thread.id]), {"content": "new"})
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.json()["reply_count"], 1)
+
+    def test_course_resources_send_no_last_modified(self):
+        response = self.client.get(reverse("api_course_resources", args=[self.course.id]))
+        self.assertNotIn("Last-Modified", response)
+        self.assertIn("ETag", response)
+
+    def test_lists_and_pages(self):
+        response = self.client.get(reverse("api_thread_list"))
+        self.assertEqual([t["id"] for t in response.json()["results"]], [self.thread.id])
+        self.assertEqual(
+            self.client.get(reverse("api_thread_list"), HTTP_IF_NONE_MATCH=response["ETag"]).status_code,
+            304,
+        )
+
+        replies_url = reverse("api_thread_replies", args=[self.thread.id])
+        first = self.client.get(replies_url).json()
+        self.assertEqual(len(first["results"]), 25)
+        second = self.client.get(replies_url, {"cursor": first["next"]}).json()
+        self.assertEqual(len(second["results"]), 5)
+
+        courses = self.client.get(reverse("api_course_list")).json()["results"]
+        resources = self.client.get(courses[0]["resources_url"]).json()
+        self.assertEqual(resources["results"][0]["link"], "https://example.com/a.pdf")
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("api_thread_list")).status_code, 401)
+
+
+class ConditionalGetTests(ForumTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user("other", password="pass")
+        cls.reply = Reply.objects.create(thread=cls.thread, author=cls.user, content="hi")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_detail_revalidates_before_main_queries(self):
+        url = reverse("thread_detail", args=[self.thread.id])
+        self.client.get(url)  # the first visit sets the CSRF cookie
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        # session + user + validators; no thread / reply queries
+        self.assertLessEqual(len(ctx.captured_queries), 3)
+
+    def test_votes_and_users_change_the_etag(self):
+        url = reverse("thread_detail", args=[self.thread.id])
+        self.client.get(url)
+        etag = self.client.get(url)["ETag"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.force_login(self.user)
+        etag = self.client.get(url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("vote", args=["reply", self.reply.id, "up"]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_list_revalidates(self):
+        url = reverse("thread_list")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("add_reply", args=[self.thread.id]), {"content": "new"})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class StaticAssetTests(ForumTestCase):
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pages_link_stylesheets_instead_of_inlining(self):
+        response = self.client.get(reverse("thread_list"))
+        self.assertNotContains(response, "<style")
+        self.assertContains(response, "forum/css/base")
+        self.assertContains(response, "forum/css/thread_list")
+
+    def test_html_is_gzipped_but_event_streams_are_not(self):
+        response = self.client.get(reverse("thread_list"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+        stream = StreamingHttpResponse(iter([b"data: x\n\n"] * 100), content_type="text/event-stream")
+        request = RequestFactory().get("/", HTTP_ACCEPT_ENCODING="gzip")
+        response = GZipMiddleware(lambda r: stream)(request)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_api_keeps_strong_etags(self):
+        response = self.client.get(reverse("api_thread_list"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]{40}"$')
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        with tempfile.TemporaryDirectory() as root, override_settings(STATIC_ROOT=root):
+            call_command("collectstatic", interactive=False, verbosity=0)
+            hashed = staticfiles_storage.stored_name("forum/css/base.css")
+
+            self.assertRegex(hashed, r"^forum/css/base\.[0-9a-f]{12}\.css$")
+            with open(os.path.join(root, hashed + ".gz"), "rb") as f:
+                compressed = f.read()
+            with open(os.path.join(root, hashed), "rb") as f:
+                self.assertEqual(gzip.decompress(compressed), f.read())
+
+
+class CourseCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("student", password="pass")
+        cls.category = Category.objects.create(name="Academics", slug="academics")
+        cls.course = Course.objects.create(
+            code="CS F111", title="Computer Programming", department="Computer Science"
+        )
+        Course.objects.create(code="MATH F111", title="Mathematics I", department="Mathematics")
+        cls.slides = Resource.objects.create(
+            course=cls.course, title="Slides", resource_type="pdf", link="https://example.com/a.pdf"
+        )
+        Resource.objects.create(
+            course=cls.course, title="Lecture 1", resource_type="video", link="https://example.com/v1"
+        )
+        cls.thread = Thread.objects.create(
+            title="Doubt in slides", content="?", author=cls.user, category=cls.category
+        )
+        cls.thread.resources.add(cls.slides)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+        self.url = reverse("course_detail", args=[self.course.id])
+
+    def test_catalog_and_department_pages(self):
+        response = self.client.get(reverse("course_catalog"))
+        self.assertContains(response, "Computer Science")
+        self.assertContains(response, "Mathematics")
+
+        response = self.client.get(reverse("department_detail", args=["Computer Science"]))
+        self.assertContains(response, "CS F111")
+        self.assertContains(response, "2 resources")
+        self.assertNotContains(response, "MATH F111")
+
+        response = self.client.get(reverse("department_detail", args=["Alchemy"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_course_page_lists_resources_and_linked_threads(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "Slides")
+        self.assertContains(response, "Lecture 1")
+        self.assertContains(response, "Doubt in slides")
+        self.assertContains(response, "PDF (1)")
+
+        response = self.client.get(self.url, {"type": "video"})
+        self.assertContains(response, "Lecture 1")
+        self.assertNotContains(response, "https://example.com/a.pdf")
+
+    def test_cached_course_page_skips_listing_queries(self):
+        self.client.get(self.url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertContains(response, "Slides")
+        for query in ctx.captured_queries:
+            self.assertNotIn("forum_resource", query["sql"])
+
+    def test_new_resource_invalidates_course_page(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Resource.objects.create(
+                course=self.course, title="Tutorial sheet", resource_type="pdf", link="https://example.com/t.pdf"
+            )
+
+        self.assertContains(self.client.get(self.url), "Tutorial sheet")
+
+    def test_create_thread_can_share_a_resource(self):
+        data = {
+            "title": "Notes",
+            "content": "sharing",
+            "category": self.category.id,
+            "resource_url": "https://example.com/notes.pdf",
+            "resource_title": "Notes",
+            "resource_type": "pdf",
+        }
+        response = self.client.post(reverse("create_thread"), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Thread.objects.filter(title="Notes").exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse("create_thread"), {**data, "resource_course": self.course.id}
+            )
+        thread = Thread.objects.get(title="Notes")
+        self.assertRedirects(response, reverse("thread_detail", args=[thread.id]))
+        self.assertEqual(thread.resources.get().link, "https://example.com/notes.pdf")
+
+        self.assertContains(self.client.get(self.url), "Notes")
+        self.assertContains(
+            self.client.get(reverse("thread_detail", args=[thread.id])),
+            'href="https://example.com/notes.pdf"',
+        )
+
+
+class RateLimitTests(ForumTestCase):
+    CHECKS = 2000
+    OVERHEAD_BUDGET = 0.001  # seconds per check
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.moderator = User.objects.create_user("mod", password="pass")
+        cls.moderator.groups.add(Group.objects.create(name="Moderators"))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_allows_burst_then_refills(self):
+        now = 1_000_000_000
+        with mock.patch("forum.throttling._now_ms", side_effect=lambda: now):
+            self.assertEqual([consume("k", 3, 60) for _ in range(3)], [0, 0, 0])
+            self.assertEqual(consume("k", 3, 60), 20)
+            self.assertEqual(consume("k", 3, 60), 20)
+
+            now += 20_000
+            self.assertEqual(consume("k", 3, 60), 0)
+            self.assertEqual(consume("k", 3, 60), 20)
+
+            # a long pause refills the bucket, but never beyond the burst
+            now += 3_600_000
+            self.assertEqual([consume("k", 3, 60) for _ in range(4)], [0, 0, 0, 20])
+
+    def test_flood_gets_429_with_retry_after(self):
+        self.client.force_login(self.user)
+        url = reverse("add_reply", args=[self.thread.id])
+        burst, period = limit_for(self.user, "reply")
+
+        for i in range(burst):
+            self.assertEqual(self.client.post(url, {"content": f"reply {i}"}).status_code, 302)
+        response = self.client.post(url, {"content": "one too many"})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertLessEqual(int(response["Retry-After"]), period)
+        self.assertEqual(Reply.objects.filter(thread=self.thread).count(), burst)
+
+        # reading is never limited
+        self.assertEqual(self.client.get(reverse("thread_detail", args=[self.thread.id])).status_code, 200)
+
+    def test_group_limits_replace_the_default(self):
+        self.assertIsNotNone(limit_for(self.user, "reply"))
+        self.assertIsNone(limit_for(self.moderator, "reply"))
+
+    def test_check_overhead(self):
+        users = [self.user, self.moderator]
+        check(self.user, "vote")  # warm the permission cache
+
+        start = time.perf_counter()
+        for i in range(self.CHECKS):
+            check(users[i % 2], "vote")
+        per_check = (time.perf_counter() - start) / self.CHECKS
+
+        self.assertLess(per_check, self.OVERHEAD_BUDGET)
+
+
+@jobs.handler("test.flaky")
+def flaky_job(fail):
+    if fail:
+        raise RuntimeError("boom")
+
+
+class JobQueueTests(ForumTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        jobs.run_pending()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reply_is_indexed_and_ranked_by_the_worker(self):
+        self.client.force_login(self.user)
+        self.client.post(reverse("add_reply", args=[self.thread.id]), {"content": "quaternion"})
+
+        self.assertEqual(
+            set(Job.objects.filter(status=Job.QUEUED).values_list("name", flat=True)),
+            {"search.sync", "rank_threads", "notifications.fan_out"},
+        )
+        search = jobs.get_search_backend()
+        self.assertEqual(search.search("quaternion"), [])
+
+        out = StringIO()
+        call_command("run_worker", "--once", stdout=out)
+        self.assertIn("Ran 3 jobs", out.getvalue())
+        self.assertEqual(len(search.search("quaternion")), 1)
+        self.assertFalse(Thread.objects.get(id=self.thread.id).rank_stale)
+
+        out = StringIO()
+        call_command("run_worker", "--stats", stdout=out)
+        self.assertRegex(out.getvalue(), r"search\.sync\s+2\s+0\s+0")
+
+    def test_unique_jobs_are_queued_once(self):
+        jobs.enqueue("rank_threads", unique_key="rank_threads")
+        jobs.enqueue("rank_threads", unique_key="rank_threads")
+        self.assertEqual(Job.objects.filter(name="rank_threads", status=Job.QUEUED).count(), 1)
+
+        # once claimed, the same work can be queued again
+        jobs.claim("a")
+        jobs.enqueue("rank_threads", unique_key="rank_threads")
+        self.assertEqual(Job.objects.filter(name="rank_threads").count(), 2)
+
+    def test_claimed_jobs_are_not_handed_out_twice(self):
+        jobs.enqueue("test.flaky", {"fail": False})
+        jobs.enqueue("test.flaky", {"fail": False})
+
+        first = jobs.claim("a", batch_size=1)
+        second = jobs.claim("b", batch_size=5)
+        self.assertEqual(len(first), 1)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first[0].id, second[0].id)
+        self.assertEqual(jobs.claim("c"), [])
+
+        # a worker that died keeps its jobs only until the lease runs out
+        Job.objects.filter(id=first[0].id).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual([job.id for job in jobs.claim("c")], [first[0].id])
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        jobs.enqueue("test.flaky", {"fail": True})
+
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            Job.objects.filter(name="test.flaky").update(run_at=timezone.now())
+            with self.assertLogs("forum.jobs", "WARNING"):
+                self.assertEqual(jobs.run_batch(), 1)
+            job = Job.objects.get(name="test.flaky")
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn("RuntimeError: boom", job.last_error)
+            if attempt < jobs.MAX_ATTEMPTS:
+                self.assertEqual(job.status, Job.QUEUED)
+                self.assertGreater(job.run_at, timezone.now())
+
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_jobs_from_a_rolled_back_write_never_run(self):
+        try:
+            with transaction.atomic():
+                jobs.enqueue("test.flaky", {"fail": False})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(Job.objects.filter(name="test.flaky").exists())
+
+
+class NotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user("author", password="pass")
+        cls.follower = User.objects.create_user("follower", password="pass")
+        cls.reader = User.objects.create_user("reader", password="pass")
+        category = Category.objects.create(name="Academics", slug="academics")
+        cls.thread = Thread.objects.create(
+            title="Doubts", content="?", author=cls.author, category=category
+        )
+        cls.other = Thread.objects.create(
+            title="More doubts", content="?", author=cls.author, category=category
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def reply(self, user, thread, content="answer"):
+        self.client.force_login(user)
+        self.client.post(reverse("add_reply", args=[thread.id]), {"content": content})
+        return Reply.objects.filter(thread=thread).latest("id")
+
+    def test_replies_fan_out_to_followers_off_the_request_path(self):
+        self.client.force_login(self.follower)
+        self.client.post(reverse("subscribe", args=[self.thread.id]), {"mode": "instant"})
+
+        reply = self.reply(self.reader, self.thread)
+        self.assertFalse(Notification.objects.exists())
+
+        jobs.run_pending()
+        notification = Notification.objects.get()
+        self.assertEqual((notification.user, notification.reply), (self.follower, reply))
+        # the replier follows the thread now and hears about the next reply
+        self.assertTrue(Subscription.objects.filter(user=self.reader, thread=self.thread).exists())
+
+        self.reply(self.follower, self.thread)
+        jobs.run_pending()
+        self.assertEqual(Notification.objects.filter(user=self.reader).count(), 1)
+
+        # a job that runs twice does not notify twice
+        notifications.fan_out(reply.id)
+        self.assertEqual(Notification.objects.filter(user=self.follower).count(), 1)
+
+    def test_badge_is_counted_once_per_change(self):
+        notifications.subscribe(self.follower, self.thread.id)
+        self.client.force_login(self.follower)
+        url = reverse("search")
+
+        self.assertNotContains(self.client.get(url), 'class="badge unread"')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertFalse([q for q in ctx.captured_queries if "forum_notification" in q["sql"]])
+
+        self.reply(self.reader, self.thread)
+        jobs.run_pending()
+        self.client.force_login(self.follower)
+        self.assertContains(self.client.get(url), '<span class="badge unread">1</span>')
+
+        notification = Notification.objects.get(user=self.follower)
+        response = self.client.get(reverse("open_notification", args=[notification.id]))
+        self.assertRedirects(
+            response,
+            reverse("thread_detail", args=[self.thread.id])
+            + f"?cursor={CursorPaginator.cursor_ending_at(notification.reply)}#reply-{notification.reply_id}",
+            fetch_redirect_response=False,
+        )
+        self.assertNotContains(self.client.get(url), 'class="badge unread"')
+
+    def test_digest_groups_replies_into_one_notification(self):
+        self.client.force_login(self.follower)
+        for thread in (self.thread, self.other):
+            self.client.post(reverse("subscribe", args=[thread.id]), {"mode": "digest"})
+
+        self.reply(self.reader, self.thread)
+        self.reply(self.reader, self.thread)
+        self.reply(self.reader, self.other)
+        self.reply(self.follower, self.other)  # their own reply is not news
+        jobs.run_pending()
+        self.assertFalse(Notification.objects.filter(user=self.follower).exists())
+
+        out = StringIO()
+        call_command("send_digests", stdout=out)
+        self.assertIn("Sent 1 digests", out.getvalue())
+        digest = Notification.objects.get(user=self.follower)
+        self.assertEqual((digest.kind, digest.count, digest.thread), (Notification.DIGEST, 3, None))
+
+        self.assertEqual(notifications.send_digests(), 0)
+
+    def test_follow_button_reflects_subscription(self):
+        self.client.force_login(self.follower)
+        url = reverse("thread_detail", args=[self.thread.id])
+        self.assertContains(self.client.get(url), 'value="instant">Follow</button>')
+
+        self.client.post(reverse("subscribe", args=[self.thread.id]), {"mode": "digest"})
+        self.assertContains(self.client.get(url), "Unfollow")
+
+        self.client.post(reverse("subscribe", args=[self.thread.id]), {"mode": "off"})
+        self.assertFalse(Subscription.objects.exists())
+
+
+class PerformanceMiddlewareTests(ForumTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_user("staff", password="pass", is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        performance.histogram.clear()
+
+    def server_timing(self, response):
+        return dict(
+            (name, params)
+            for name, _, params in (
+                part.strip().partition(";") for part in response["Server-Timing"].split(",")
+            )
+        )
+
+    def test_server_timing_counts_queries_of_async_views(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("thread_list"))
+
+        timing = self.server_timing(response)
+        self.assertIn(f'desc="{len(ctx.captured_queries)} queries"', timing["db"])
+        self.assertRegex(timing["tpl"], r"^dur=\d+\.\d$")
+        self.assertIn(f'desc="{len(response.content)} bytes"', timing["size"])
+
+    def test_staff_page_shows_percentiles_per_view(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(reverse("thread_detail", args=[self.thread.id]))
+        self.assertEqual(self.client.get(reverse("performance_stats")).status_code, 403)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("performance_stats"))
+        row = next(row for row in response.context["rows"] if row["name"] == "thread_detail")
+        self.assertEqual(row["count"], 3)
+        self.assertLessEqual(row["wall_ms_p50"], row["wall_ms_p99"])
+        self.assertContains(response, "<td>thread_detail</td>", html=False)
+
+    def test_query_budget_overruns_are_logged(self):
+        self.client.force_login(self.user)
+        with mock.patch("forum.performance.QUERY_BUDGET", 2):
+            with self.assertLogs("forum.performance", "WARNING") as logs:
+                self.client.get(reverse("search"))
+        self.assertIn("GET /threads/search/ ran", logs.output[0])
+
+
+class MetricsTests(ForumTestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        # a fresh store per test, writing where a sibling process would
+        patcher = mock.patch.object(metrics, "store", metrics.Store(self.directory))
+        self.store = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def counter(self, name, **labels):
+        return self.store.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def test_scrape_adds_up_every_process(self):
+        other = metrics.Store(self.directory)
+        other.inc("forum_created_total", 2, kind="vote")
+        other.observe("forum_request_duration_seconds", 30, view="thread_detail")
+        other.flush()
+
+        self.client.force_login(self.user)
+        self.client.get(reverse("thread_detail", args=[self.thread.id]))
+        metrics.inc("forum_created_total", kind="vote")
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8")
+        body = response.content.decode()
+        self.assertIn("# TYPE forum_request_duration_seconds histogram", body)
+        self.assertIn('forum_created_total{kind="vote"} 3', body)
+        self.assertIn('forum_request_duration_seconds_count{view="thread_detail"} 2', body)
+        self.assertIn('forum_request_duration_seconds_bucket{view="thread_detail",le="10"} 1', body)
+        self.assertIn('forum_request_duration_seconds_bucket{view="thread_detail",le="+Inf"} 2', body)
+        self.assertIn('forum_requests_total{status="2xx",view="thread_detail"} 1', body)
+
+    def test_activity_and_cache_reads_are_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Reply.objects.create(thread=self.thread, author=self.user, content="!")
+            toggle_vote(self.user, self.thread, Vote.UPVOTE)
+        file_report(self.user, "thread", self.thread.id, "spam")
+        self.assertEqual(self.counter("forum_created_total", kind="reply"), 1)
+        self.assertEqual(self.counter("forum_created_total", kind="vote"), 1)
+        self.assertEqual(self.counter("forum_created_total", kind="report"), 1)
+
+        notifications.unread_count(self.user)
+        notifications.unread_count(self.user)
+        self.assertEqual(self.counter("forum_cache_requests_total", family="forum:unread", result="miss"), 1)
+        self.assertEqual(self.counter("forum_cache_requests_total", family="forum:unread", result="hit"), 1)
+
+    def test_get_many_counts_each_key_once(self):
+        cache.set("forum:v:thread:1", 1)
+        cache.get_many(["forum:v:thread:1", "forum:v:thread:2"])
+        self.assertEqual(self.counter("forum_cache_requests_total", family="forum:v", result="hit"), 1)
+        self.assertEqual(self.counter("forum_cache_requests_total", family="forum:v", result="miss"), 1)
+
+    def test_lock_retries_are_counted(self):
+        attempts = []
+
+        @retry_on_lock(base_delay=0)
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError("database is locked")
+
+        write()
+        self.assertEqual(self.counter("forum_db_lock_retries_total"), 2)
+
+    def test_token_required_when_configured(self):
+        with mock.patch("forum.views.METRICS_TOKEN", "s3cret"):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+
+
+class ConcurrentVoteTests(TransactionTestCase):
+    USERS = 40
+    CLICKS_PER_USER = 50
+    WORKERS = 8
+
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            [User(username=f"voter{i}") for i in range(self.USERS)]
+        )
+        author = User.objects.create_user("author")
+        category = Category.objects.create(name="Academics", slug="academics")
+        self.thread = Thread.objects.create(
+            title="Hot thread", content="...", author=author, category=category
+        )
+        self.reply = Reply.objects.create(thread=self.thread, author=author, content="...")
+
+    def click_storm(self, user_index):
+        # each user mashes ▲/▼ on both targets; the last click decides their vote
+        rng = random.Random(user_index)
+        user = self.users[user_index]
+        final = {}
+        try:
+            for _ in range(self.CLICKS_PER_USER):
+                obj = rng.choice([self.thread, self.reply])
+                final[type(obj)] = toggle_vote(user, obj, rng.choice([1, -1]))
+        finally:
+            connection.close()
+        return final
+
+    def test_parallel_votes_keep_counters_exact(self):
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            outcomes = list(pool.map(self.click_storm, range(self.USERS)))
+
+        for obj in (self.thread, self.reply):
+            expected = [o.get(type(obj), 0) for o in outcomes]
+            obj.refresh_from_db()
+
+            self.assertEqual(obj.score, sum(expected))
+            self.assertEqual(obj.upvote_count, expected.count(1))
+            self.assertEqual(obj.downvote_count, expected.count(-1))
+
+            target = "thread" if isinstance(obj, Thread) else "reply"
+            self.assertEqual(
+                Vote.objects.filter(**{target: obj}).count(),
+                len([v for v in expected if v]),
+            )
+
+    def test_one_user_clicking_at_once_leaves_one_vote(self):
+        # the race the unique constraint guards: the same (user, object)
+        # from several requests at the same moment
+        user = self.users[0]
+        clicks = 5
+        for obj in (self.thread, self.reply):
+            start = threading.Barrier(clicks)
+
+            def click(_):
+                try:
+                    start.wait()
+                    return toggle_vote(user, obj, Vote.UPVOTE)
+                finally:
+                    connection.close()
+
+            with ThreadPoolExecutor(max_workers=clicks) as pool:
+                results = list(pool.map(click, range(clicks)))
+
+            # as if the clicks had come one after another: vote, unvote, ...
+            self.assertEqual(sorted(results), [0, 0, 1, 1, 1])
+            target = "thread" if isinstance(obj, Thread) else "reply"
+            self.assertEqual(Vote.objects.filter(user=user, **{target: obj}).count(), 1)
+            obj.refresh_from_db()
+            self.assertEqual((obj.score, obj.upvote_count, obj.downvote_count), (1, 1, 0))
+
+    def test_persistent_integrity_errors_are_raised(self):
+        # not the unique race: retrying would never get anywhere
+        with mock.patch.object(Vote.objects, "create", side_effect=IntegrityError("CHECK")) as create:
+            with self.assertRaises(IntegrityError):
+                toggle_vote(self.users[0], self.thread, 1)
+        self.assertEqual(create.call_count, 3)
@@ -0,0 +1,137 @@
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+from . import caching, permissions
+
+
+_UNITS = {"s": 1, "m": 60, "h": 60 * 60, "d": 60 * 60 * 24}
+
+# A bucket lives this many periods after it was last refilled from empty.
+# A client that is never idle that long gets one fresh bucket per lifetime.
+BUCKET_LIFETIME = 10
+
+
+def parse_rate(rate):
+    """
+    "burst/period" -> (burst, seconds): a bucket of burst tokens that refills
+    evenly over the period, e.g. "10/m" or "3/10m". None means unlimited.
+    """
+    if rate is None:
+        return None
+    try:
+        burst, period = rate.split("/")
+        count = int(period[:-1] or 1)
+        return int(burst), count * _UNITS[period[-1]]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured(f"Bad FORUM_RATE_LIMITS rate {rate!r}")
+
+
+# Per action; "default" applies to everyone and a group's entries replace it
+# for that group's members, the most generous one winning for users in
+# several groups. Superusers are never limited.
+RATE_LIMITS = {
+    group: {action: parse_rate(rate) for action, rate in rates.items()}
+    for group, rates in getattr(
+        settings,
+        "FORUM_RATE_LIMITS",
+        {"default": {"thread": "3/10m", "reply": "10/m", "vote": "60/m", "report": "10/h"}},
+    ).items()
+}
+
+
+def limit_for(user, action):
+    if user.is_superuser:
+        return None
+
+    limits = []
+    # skip the group lookup when no group has its own limits
+    if len(RATE_LIMITS) > 1 or "default" not in RATE_LIMITS:
+        limits = [
+            RATE_LIMITS[name][action]
+            for name in permissions.user_group_names(user)
+            if action in RATE_LIMITS.get(name, {})
+        ]
+    if not limits:
+        limits = [RATE_LIMITS.get("default", {}).get(action)]
+
+    if None in limits:
+        return None
+    return max(limits, key=lambda limit: (limit[0] / limit[1], limit[0]))
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def consume(key, burst, period):
+    """
+    Take one token from the bucket at key. Returns 0 when allowed, otherwise
+    the whole seconds until a token is available.
+
+    The bucket is stored as one number (GCRA): the time, in ms, at which it
+    would be full again. Each request pushes it one token's worth into the
+    future with an atomic incr and is allowed while that stays within one
+    period of now; a refused request takes its increment back. So a check
+    is one or two cache round trips and never a read-modify-write.
+    """
+    cache = caching.get_cache()
+    interval = period * 1000 // burst
+    now = _now_ms()
+
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        full_at = None
+
+    if full_at is None or full_at - interval < now:
+        # new bucket, or idle long enough to be full; racing resets can only
+        # let a request or two more through
+        cache.set(key, now + interval, period * BUCKET_LIFETIME)
+        return 0
+
+    if full_at - now <= period * 1000:
+        return 0
+
+    cache.decr(key, interval)
+    return max(1, math.ceil((full_at - now - period * 1000) / 1000))
+
+
+def check(user, action):
+    limit = limit_for(user, action)
+    if limit is None:
+        return 0
+    return consume(f"forum:rl:{action}:{user.id}", *limit)
+
+
+def too_many_requests(wait):
+    response = HttpResponse(
+        f"Too many requests, try again in {wait} second{'s' if wait != 1 else ''}",
+        status=429,
+    )
+    response["Retry-After"] = str(wait)
+    return response
+
+
+def rate_limit(action, methods=("POST",)):
+    """
+    Throttle a view per user and action. Only the given methods are counted
+    (None counts every request); over the limit the view is not called.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if methods is None or request.method in methods:
+                wait = check(request.user, action)
+                if wait:
+                    return too_many_requests(wait)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
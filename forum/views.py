@@ -1,13 +1,46 @@
+import hmac
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIRequest
 from django.core.exceptions import PermissionDenied
-from django.shortcuts import get_object_or_404, redirect, render
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.views.decorators.http import require_POST
-from django.http import HttpResponse
-from django.core.paginator import Paginator
-
-from .models import Reply, Thread,  Resource, Vote, Report
+from django.http import Http404, HttpResponse, JsonResponse
+from django.db import transaction
+from django.db.models import Count, F, Q, Window
+from django.db.models.functions import Now, RowNumber
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from .models import Course, Notification, Reply, Thread,  Resource, Report, ReportTarget
+from . import jobs, live, metrics, notifications, performance
+from .caching import CACHE_ALIAS, COURSE_PAGE_TIMEOUT, FRAGMENT_TIMEOUT
+from .caching import aattach_versions, attach_versions, get_versions
+from .caching import bump as bump_cache_version, touch_threads
+from .conditional import thread_list_validators, thread_page_validators
 from .forms import ReplyForm, ThreadForm
+from .moderation import BULK_ACTIONS, PURGE_PERMISSIONS, bulk_moderate, file_report, resolve_target
+from .pagination import CursorPaginator, page_number
+from .ranking import TOP_WINDOWS, top_since
+from .search import get_backend as get_search_backend
+from .throttling import rate_limit
+from .voting import toggle_vote
+
+
+THREADS_PER_PAGE = 15
+REPLIES_PER_PAGE = 10
+SEARCH_RESULTS_PER_PAGE = 20
+REPORTS_PER_PAGE = 25
+# reasons shown on each report queue card
+REPORT_REASONS_SHOWN = 3
+NOTIFICATIONS_PER_PAGE = 20
+MAX_BULK_IDS = 500
+COURSE_RESOURCES_PER_PAGE = 20
+COURSE_THREADS = 10
 
 
 @login_required
@@ -16,8 +49,27 @@ def delete_reply(request, reply_id):
     reply = get_object_or_404(Reply, id=reply_id)
 
     if request.user == reply.author or request.user.has_perm("forum.delete_any_reply"):
-        reply.is_deleted = True
-        reply.save()
+        with transaction.atomic():
+            # conditional, so concurrent deletes of the same reply (author and
+            # moderator, a double submit) take the count down only once
+            deleted = Reply.objects.filter(id=reply.id, is_deleted=False).update(
+                is_deleted=True, updated_at=timezone.now()
+            )
+            if deleted:
+                Thread.objects.filter(id=reply.thread_id).update( #type: ignore
+                    reply_count=F("reply_count") - 1, rank_stale=True, updated_at=Now()
+                )
+                # .update() skips the post_save receivers, so do their work here
+                jobs.enqueue(
+                    "search.sync",
+                    {"kind": "reply", "id": reply.id},
+                    unique_key=f"search:reply:{reply.id}",
+                )
+                jobs.enqueue("rank_threads", unique_key="rank_threads")
+                bump_cache_version("reply", reply.id) #type: ignore
+                bump_cache_version("thread", reply.thread_id) #type: ignore
+                touch_threads([reply.thread_id]) #type: ignore
+                live.publish(reply.thread_id, "delete", id=reply.id) #type: ignore
         return redirect(request.META.get("HTTP_REFERER", "/"))
 
     raise PermissionDenied
@@ -36,6 +88,71 @@ def ban_user(request, user_id):
     return redirect(request.META.get("HTTP_REFERER", "/"))
 
 
+@login_required
+@require_POST
+def bulk_moderation(request):
+    """
+    POST action=lock|delete|ban|resolve and ids (repeated or comma separated:
+    thread, reply, user or report target ids). ban also takes purge_days to
+    soft-delete the users' recent content. Returns a JSON summary.
+    """
+    action = request.POST.get("action")
+    if action not in BULK_ACTIONS:
+        return JsonResponse({"error": "unknown action"}, status=400)
+
+    if not request.user.has_perm(BULK_ACTIONS[action]):
+        raise PermissionDenied
+
+    try:
+        ids = sorted({
+            int(value)
+            for raw in request.POST.getlist("ids")
+            for value in raw.split(",")
+            if value.strip()
+        })
+        purge_days = int(request.POST.get("purge_days") or 0)
+    except ValueError:
+        return JsonResponse({"error": "ids and purge_days must be integers"}, status=400)
+
+    if not ids or len(ids) > MAX_BULK_IDS:
+        return JsonResponse({"error": f"send between 1 and {MAX_BULK_IDS} ids"}, status=400)
+
+    if action == "ban" and purge_days > 0 and not request.user.has_perms(PURGE_PERMISSIONS):
+        raise PermissionDenied
+
+    return JsonResponse(bulk_moderate(request.user, action, ids, max(purge_days, 0)))
+
+
+@login_required
+def performance_stats(request):
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    return render(
+        request,
+        "forum/performance.html",
+        {
+            "rows": performance.histogram.summary(),
+            "samples": performance.histogram.size,
+            "query_budget": performance.QUERY_BUDGET,
+        },
+    )
+
+
+# Prometheus scrapes send "Authorization: Bearer <token>"; None leaves
+# /metrics open, for when only the scraper can reach it
+METRICS_TOKEN = getattr(settings, "FORUM_METRICS_TOKEN", None)
+
+
+def prometheus_metrics(request):
+    if METRICS_TOKEN is not None and not request.user.is_staff:
+        given = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(given.encode(), METRICS_TOKEN.encode()):
+            raise PermissionDenied
+
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @login_required
 @require_POST
 def lock_thread(request, thread_id):
@@ -44,54 +161,103 @@ def lock_thread(request, thread_id):
 
     thread = get_object_or_404(Thread, id=thread_id)
     thread.is_locked = True
-    thread.save()
+    thread.save(update_fields=["is_locked", "updated_at"])
+    live.publish(thread.id, "lock") #type: ignore
 
     return redirect(request.META.get("HTTP_REFERER", "/"))
 
-@login_required
-def thread_detail(request, thread_id):
-    thread = get_object_or_404(Thread, id=thread_id)
-
-    replies = Reply.objects.filter(thread=thread).order_by("created_at")
+async def arender(request, template_name, context):
+    # reuse the user the async auth check already loaded instead of letting
+    # the lazy request.user fetch it again
+    request.user = await request.auser()
 
-    paginator = Paginator(replies, 10)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # templates still read perms, which is sync ORM work; render in the
+    # thread pool so it never blocks the event loop
+    return await sync_to_async(render)(request, template_name, context)
 
 
-    thread_vote = 0
-    reply_votes = {}
+@login_required
+async def thread_detail(request, thread_id):
+    user = request.user = await request.auser()
+
+    # answer revalidations before loading anything else
+    validators = await thread_page_validators(request, thread_id)
+    if validators is None:
+        raise Http404
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    # scores are stored columns and the user's votes come back as
+    # annotations, so the page costs one query for the thread and one for
+    # the replies no matter how many votes exist
+    thread = await aget_object_or_404(
+        Thread.objects.select_related("author", "category")
+        .prefetch_related("resources")
+        .with_user_vote(user)
+        .with_subscription(user),
+        id=thread_id,
+    )
 
-    if request.user.is_authenticated:
-        thread_vote_obj = Vote.objects.filter(
-            user=request.user, thread=thread
-        ).first()
-        if thread_vote_obj:
-            thread_vote = thread_vote_obj.value
+    replies = (
+        Reply.objects.filter(thread=thread)
+        .select_related("author")
+        .with_user_vote(user)
+    )
 
-        reply_vote_qs = Vote.objects.filter(
-            user=request.user, reply__in=page_obj
-        )
-        reply_votes = {v.reply_id: v.value for v in reply_vote_qs} #type: ignore
+    paginator = CursorPaginator(replies, REPLIES_PER_PAGE)
+    page_obj = await paginator.aget_page(request.GET)
 
-        for reply in page_obj:
-            reply.vote_value = reply_votes.get(reply.id, 0)
+    await aattach_versions("thread", [thread])
+    await aattach_versions("reply", page_obj.object_list)
 
-    return render(
+    response = await arender(
         request,
         "forum/thread_detail.html",
         {
             "thread": thread,
             "page_obj": page_obj,
-            "thread_vote": thread_vote,
-            "reply_votes": reply_votes,
+            "fragment_timeout": FRAGMENT_TIMEOUT,
+            "cache_alias": CACHE_ALIAS,
+            "live_updates": live.ENABLED,
         },
     )
+    return validators.apply(response)
+
+
+@login_required
+async def thread_events(request, thread_id):
+    """
+    Server-sent events for one thread: "reply", "score", "delete" and
+    "lock". Only streamed under ASGI with FORUM_LIVE_UPDATES on; otherwise
+    204, which tells EventSource to stop reconnecting.
+    """
+    if not live.ENABLED or not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+
+    if not await Thread.objects.filter(id=thread_id).aexists():
+        raise Http404
+
+    if not live.limiter.acquire(user.id):
+        response = HttpResponse("Too many live connections", status=503)
+        response["Retry-After"] = "30"
+        return response
+
+    return live.EventStreamResponse(live.get_broker().subscribe(thread_id), user.id)
 
 
 @login_required
-def thread_list(request):
-    threads = Thread.objects.all()
+async def thread_list(request):
+    request.user = await request.auser()
+
+    validators = await thread_list_validators(request)
+    not_modified = validators.not_modified(request)
+    if not_modified is not None:
+        return not_modified
+
+    threads = Thread.objects.for_listing()
 
     category_slug = request.GET.get("category")
     tag_slug = request.GET.get("tag")
@@ -102,25 +268,94 @@ def thread_list(request):
     if tag_slug:
         threads = threads.filter(tags__slug=tag_slug.lower())
 
-    threads = threads.order_by("-created_at")
+    # new: by date; hot: precomputed hot_rank (index scan, see ranking.py);
+    # top: best score among threads started in the window
+    sort = request.GET.get("sort")
+    window = request.GET.get("t")
+    if sort == "hot":
+        key = "hot_rank"
+    elif sort == "top":
+        if window not in TOP_WINDOWS:
+            window = "week"
+        threads = threads.filter(created_at__gte=top_since(window))
+        key = "score"
+    else:
+        sort, key = "new", "created_at"
 
-    paginator = Paginator(threads, 15)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    paginator = CursorPaginator(threads, THREADS_PER_PAGE, descending=True, key=key)
+    page_obj = await paginator.aget_page(request.GET)
+    await aattach_versions("thread", page_obj.object_list)
 
-    return render(
+    response = await arender(
         request,
         "forum/thread_list.html",
         {
             "page_obj": page_obj,
             "selected_category": category_slug,
             "selected_tag": tag_slug,
+            "sort": sort,
+            "window": window,
+            "top_windows": TOP_WINDOWS,
+            "fragment_timeout": FRAGMENT_TIMEOUT,
+            "cache_alias": CACHE_ALIAS,
         },
     )
+    return validators.apply(response)
+
+
+
+@login_required
+def search(request):
+    query = request.GET.get("q", "").strip()
+    category_slug = request.GET.get("category") or None
+    tag_slug = request.GET.get("tag") or None
+
+    page = page_number(request.GET.get("page", 1))
+
+    results = []
+    has_next = False
+
+    if query:
+        hits = get_search_backend().search(
+            query,
+            category=category_slug and category_slug.lower(),
+            tag=tag_slug and tag_slug.lower(),
+            limit=SEARCH_RESULTS_PER_PAGE + 1,
+            offset=(page - 1) * SEARCH_RESULTS_PER_PAGE,
+        )
+        has_next = len(hits) > SEARCH_RESULTS_PER_PAGE
+        results = hits[:SEARCH_RESULTS_PER_PAGE]
+
+        threads = Thread.objects.only("id", "title").in_bulk(
+            {hit.thread_id for hit in results}
+        )
+        replies = Reply.objects.only("id", "created_at").in_bulk(
+            [hit.object_id for hit in results if hit.kind == "reply"]
+        )
+        for hit in results:
+            hit.thread = threads.get(hit.thread_id)
+            hit.url = reverse("thread_detail", args=[hit.thread_id])
+            if hit.kind == "reply" and hit.object_id in replies:
+                cursor = CursorPaginator.cursor_ending_at(replies[hit.object_id])
+                hit.url += f"?cursor={cursor}#reply-{hit.object_id}"
+        results = [hit for hit in results if hit.thread is not None]
 
+    return render(
+        request,
+        "forum/search.html",
+        {
+            "query": query,
+            "results": results,
+            "page": page,
+            "has_next": has_next,
+            "selected_category": category_slug,
+            "selected_tag": tag_slug,
+        },
+    )
 
 
 @login_required
+@rate_limit("reply")
 def add_reply(request, thread_id):
     thread = get_object_or_404(Thread, id=thread_id)
 
@@ -133,19 +368,53 @@ def add_reply(request, thread_id):
             reply = form.save(commit=False)
             reply.author = request.user
             reply.thread = thread
-            reply.save()
 
+            with transaction.atomic():
+                reply.save()
+                Thread.objects.filter(id=thread.id).update( #type: ignore
+                    reply_count=F("reply_count") + 1, rank_stale=True, updated_at=Now()
+                )
+                jobs.enqueue("rank_threads", unique_key="rank_threads")
+                jobs.enqueue("notifications.fan_out", {"reply_id": reply.id})
+                bump_cache_version("thread", thread.id) #type: ignore
+
+            # land on the page ending at the new reply instead of counting pages
+            cursor = CursorPaginator.cursor_ending_at(reply)
+            live.publish(
+                thread.id, #type: ignore
+                "reply",
+                id=reply.id,
+                url=reverse("thread_detail", args=[thread.id]) + f"?cursor={cursor}#reply-{reply.id}", #type: ignore
+            )
+            return redirect(
+                reverse("thread_detail", args=[thread.id]) #type: ignore
+                + f"?cursor={cursor}#reply-{reply.id}"
+            )
+
+    return redirect("thread_detail", thread_id=thread.id) #type: ignore
 
-            replies_qs = Reply.objects.filter(thread=thread).order_by("created_at")
-            paginator = Paginator(replies_qs, 10)  
-            last_page = paginator.num_pages
 
-            return redirect(f"/threads/{thread.id}/?page={last_page}") #type: ignore
+@login_required
+@require_POST
+def subscribe(request, thread_id):
+    """POST mode=instant|digest|off to follow or stop following a thread."""
+    thread = get_object_or_404(Thread.objects.only("id"), id=thread_id)
+    mode = request.POST.get("mode")
+
+    if mode == "off":
+        notifications.unsubscribe(request.user, thread.id)
+    elif mode in ("instant", "digest"):
+        notifications.subscribe(request.user, thread.id, digest=mode == "digest")
+    else:
+        return HttpResponse("mode must be instant, digest or off", status=400)
 
-    return redirect("thread_detail", thread_id=thread.id) #type: ignore
+    # the follow button is part of the page's ETag
+    touch_threads([thread.id])
+    return redirect("thread_detail", thread_id=thread.id)
 
 
 @login_required
+@rate_limit("thread")
 def create_thread(request):
     if request.method == "POST":
         form = ThreadForm(request.POST)
@@ -154,17 +423,11 @@ def create_thread(request):
             thread.author = request.user
             thread.save()
             form.save_m2m()
+            notifications.subscribe(request.user, thread.id)
 
-
-            resource_url = request.POST.get("resource_url")
-            resource_title = request.POST.get("resource_title")
-
-            if resource_url:
-                resource = Resource.objects.create(
-                    title=resource_title or "Shared Resource",
-                    url=resource_url,
-                    created_by=request.user,
-                )
+            resource = form.new_resource()
+            if resource is not None:
+                resource.save()
                 thread.resources.add(resource)
 
             return redirect("thread_detail", thread_id=thread.id)
@@ -180,6 +443,7 @@ def create_thread(request):
 
 
 @login_required
+@rate_limit("vote", methods=None)
 def vote(request, kind, obj_id, direction):
     if direction == "up":
         value = 1
@@ -195,7 +459,6 @@ def vote(request, kind, obj_id, direction):
         if obj.is_locked:
             raise PermissionDenied("Thread is locked")
 
-        vote_filter = {"user": request.user, "thread": obj, "reply": None}
 
     elif kind == "reply":
         obj = get_object_or_404(Reply, id=obj_id)
@@ -207,21 +470,18 @@ def vote(request, kind, obj_id, direction):
 
         if obj.thread.is_locked:
             raise PermissionDenied("Thread is locked")
-
-        vote_filter = {"user": request.user, "reply": obj, "thread": None}
     else:
         raise PermissionDenied
 
-    existing = Vote.objects.filter(**vote_filter).first()
+    toggle_vote(request.user, obj, value)
+    if kind == "thread":
+        jobs.enqueue("rank_threads", unique_key="rank_threads")
+    bump_cache_version(kind, obj.id) #type: ignore
 
-    if existing:
-        if existing.value == value:
-            existing.delete()
-        else:
-            existing.value = value
-            existing.save()
-    else:
-        Vote.objects.create(**vote_filter, value=value)
+    score = type(obj).objects.filter(id=obj.id).values_list("score", flat=True).first() #type: ignore
+    thread_id = obj.id if kind == "thread" else obj.thread_id #type: ignore
+    live.publish(thread_id, "score", kind=kind, id=obj.id, score=score) #type: ignore
+    touch_threads([thread_id])
 
     if kind == "thread":
         return redirect("thread_detail", thread_id=obj.id) #type: ignore
@@ -230,61 +490,123 @@ def vote(request, kind, obj_id, direction):
 
 
 @login_required
+@rate_limit("report")
 def report(request):
     if request.method != "POST":
         raise PermissionDenied
 
-    Report.objects.create(
-        reporter=request.user,
-        target_type=request.POST["target_type"],
-        target_id=request.POST["target_id"],
-        reason=request.POST.get("reason", "No reason provided"),
+    target_type = request.POST["target_type"]
+    if target_type not in dict(Report.TARGET_CHOICES):
+        raise PermissionDenied
+
+    try:
+        target_id = int(request.POST["target_id"])
+    except ValueError:
+        raise PermissionDenied
+
+    file_report(
+        request.user,
+        target_type,
+        target_id,
+        request.POST.get("reason", "No reason provided"),
     )
 
     return redirect(request.META.get("HTTP_REFERER", "/"))
 
 
-@permission_required("forum.delete_any_reply")
-def report_queue(request):
-    pending_reports = Report.objects.filter(
-        status="pending"
-    ).order_by("-created_at")
+async def _attach_target_urls(targets):
+    replies = await ReportTarget.reply_targets(targets).ain_bulk()
+    for target in targets:
+        target.target_url = target.get_target_url(replies)
 
-    resolved_reports = Report.objects.filter(
-        status="resolved"
-    ).order_by("-created_at")
 
-    return render(
+@permission_required("forum.delete_any_reply")
+async def report_queue(request):
+    # most-reported first, walking the (status, -report_count, ...) index;
+    # the queue only holds open targets so a plain offset is cheap
+    page = page_number(request.GET.get("page", 1))
+
+    offset = (page - 1) * REPORTS_PER_PAGE
+    targets = [
+        target
+        async for target in ReportTarget.objects.filter(status="pending")
+        .order_by("-report_count", "-last_reported_at", "-id")[offset:offset + REPORTS_PER_PAGE + 1]
+    ]
+    has_next = len(targets) > REPORTS_PER_PAGE
+    targets = targets[:REPORTS_PER_PAGE]
+
+    await _attach_target_urls(targets)
+
+    # the latest few reports behind each target on this page, in one query;
+    # a mass-reported target must not pull in all of its reports
+    by_target = {(t.target_type, t.target_id): t for t in targets}
+    for target in targets:
+        target.pending_reports = []
+    pairs = Q()
+    for target_type, target_id in by_target:
+        pairs |= Q(target_type=target_type, target_id=target_id)
+    if by_target:
+        latest = Window(
+            RowNumber(),
+            partition_by=[F("target_type"), F("target_id")],
+            order_by=[F("created_at").desc(), F("id").desc()],
+        )
+        async for report in (
+            Report.objects.filter(pairs, status="pending")
+            .annotate(position=latest)
+            .filter(position__lte=REPORT_REASONS_SHOWN)
+            .select_related("reporter")
+            .order_by("-created_at", "-id")
+        ):
+            by_target[report.target_type, report.target_id].pending_reports.append(report)
+
+    return await arender(
         request,
         "forum/report_queue.html",
         {
-            "pending_reports": pending_reports,
-            "resolved_reports": resolved_reports,
+            "targets": targets,
+            "page": page,
+            "has_next": has_next,
+            "archive": False,
         }
     )
 
 
+@permission_required("forum.delete_any_reply")
+async def report_archive(request):
+    # resolved history only grows, so it lives on its own page and is only
+    # queried when a moderator asks for it
+    targets = ReportTarget.objects.filter(status="resolved")
+
+    paginator = CursorPaginator(targets, REPORTS_PER_PAGE, descending=True)
+    page_obj = await paginator.aget_page(request.GET)
+    await _attach_target_urls(page_obj.object_list)
+
+    return await arender(
+        request,
+        "forum/report_queue.html",
+        {
+            "page_obj": page_obj,
+            "archive": True,
+        }
+    )
+
 
 @permission_required("forum.delete_any_reply")
-def resolve_report(request, report_id):
-    report = get_object_or_404(Report, id=report_id)
-    report.status = "resolved"
-    report.save()
+@require_POST
+def resolve_report(request, target_type, target_id):
+    resolve_target(target_type, target_id)
     return redirect("report_queue")
 
 
 @login_required
+@rate_limit("report")
 def report_form(request, target_type, target_id):
     if target_type not in ["thread", "reply", "resource"]:
         raise PermissionDenied
 
     if request.method == "POST":
-        Report.objects.create(
-            reporter=request.user,
-            target_type=target_type,
-            target_id=target_id,
-            reason=request.POST["reason"],
-        )
+        file_report(request.user, target_type, target_id, request.POST["reason"])
         return redirect("/threads/")
 
     return render(
@@ -295,3 +617,145 @@ def report_form(request, target_type, target_id):
             "target_id": target_id,
         }
     )
+
+
+# Course catalog. Everything below the header is the same for every user,
+# so each page caches it in a {% cache %} block keyed on a "course" version
+# (see signals.py) and hands the template lazy querysets: a cache hit runs
+# no queries beyond loading the course.
+
+@login_required
+def course_catalog(request):
+    departments = (
+        Course.objects.values("department")
+        .annotate(course_count=Count("id"))
+        .order_by("department")
+    )
+
+    return render(
+        request,
+        "forum/course_catalog.html",
+        {
+            "departments": departments,
+            "catalog_version": get_versions("course", ["all"])["all"],
+            "page_timeout": COURSE_PAGE_TIMEOUT,
+            "cache_alias": CACHE_ALIAS,
+        },
+    )
+
+
+@login_required
+def department_detail(request, department):
+    if not Course.objects.filter(department=department).exists():
+        raise Http404
+
+    courses = (
+        Course.objects.filter(department=department)
+        .annotate(resource_count=Count("resources"))
+        .order_by("code")
+    )
+
+    return render(
+        request,
+        "forum/department_detail.html",
+        {
+            "department": department,
+            "courses": courses,
+            "catalog_version": get_versions("course", ["all"])["all"],
+            "page_timeout": COURSE_PAGE_TIMEOUT,
+            "cache_alias": CACHE_ALIAS,
+        },
+    )
+
+
+@login_required
+def course_detail(request, course_id):
+    course = get_object_or_404(Course, id=course_id)
+    attach_versions("course", [course])
+
+    resource_type = request.GET.get("type")
+    if resource_type not in dict(Resource.RESOURCE_TYPES):
+        resource_type = None
+    cursor = request.GET.get("cursor", "")
+
+    # (course, resource_type, -created_at, -id) serves both the filtered
+    # and the unfiltered listing
+    resources = Resource.objects.filter(course=course)
+    if resource_type:
+        resources = resources.filter(resource_type=resource_type)
+    paginator = CursorPaginator(resources, COURSE_RESOURCES_PER_PAGE, descending=True)
+
+    def type_counts():
+        counts = dict(
+            Resource.objects.filter(course=course)
+            .values_list("resource_type")
+            .annotate(Count("id"))
+            .order_by()
+        )
+        return [(value, label, counts.get(value, 0)) for value, label in Resource.RESOURCE_TYPES]
+
+    threads = (
+        Thread.objects.filter(
+            id__in=Thread.resources.through.objects.filter(
+                resource__course=course
+            ).values("thread_id")
+        )
+        .select_related("author")
+        .only("id", "title", "reply_count", "created_at", "author__username")
+        .order_by("-created_at")[:COURSE_THREADS]
+    )
+
+    return render(
+        request,
+        "forum/course_detail.html",
+        {
+            "course": course,
+            "selected_type": resource_type,
+            "cursor": cursor,
+            "page_obj": SimpleLazyObject(
+                lambda: paginator.get_page({"cursor": cursor})
+            ),
+            "type_counts": SimpleLazyObject(type_counts),
+            "threads": threads,
+            "page_timeout": COURSE_PAGE_TIMEOUT,
+            "cache_alias": CACHE_ALIAS,
+        },
+    )
+
+
+@login_required
+def notification_list(request):
+    items = Notification.objects.filter(user=request.user).select_related(
+        "thread", "actor"
+    ).only(
+        "id", "kind", "count", "created_at", "read_at", "reply_id",
+        "thread__id", "thread__title", "actor__username",
+    )
+    page_obj = CursorPaginator(items, NOTIFICATIONS_PER_PAGE, descending=True).get_page(request.GET)
+
+    return render(request, "forum/notifications.html", {"page_obj": page_obj})
+
+
+@login_required
+def open_notification(request, notification_id):
+    notification = get_object_or_404(
+        Notification.objects.select_related("reply"), id=notification_id, user=request.user
+    )
+    notifications.mark_read(request.user, [notification.id])
+
+    if notification.reply is not None:
+        reply = notification.reply
+        return redirect(
+            reverse("thread_detail", args=[reply.thread_id]) #type: ignore
+            + f"?cursor={CursorPaginator.cursor_ending_at(reply)}#reply-{reply.id}"
+        )
+    if notification.thread_id is not None: #type: ignore
+        return redirect("thread_detail", thread_id=notification.thread_id) #type: ignore
+    return redirect("notification_list")
+
+
+@login_required
+@require_POST
+def mark_notifications_read(request):
+    notifications.mark_read(request.user)
+    return redirect("notification_list")
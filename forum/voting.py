@@ -0,0 +1,48 @@
+from django.db import IntegrityError, transaction
+
+from .db import retry_on_lock
+from .models import Thread, Vote, apply_vote_delta
+
+
+# losing the insert race once means the other click's row is there on the
+# next pass; anything still failing after this is not that race
+INSERT_ATTEMPTS = 3
+
+
+@retry_on_lock()
+def toggle_vote(user, obj, value):
+    """
+    Apply one click on ▲ (value=1) or ▼ (value=-1) for user on a Thread or
+    Reply and return the user's vote afterwards (1, -1 or 0).
+
+    Every branch is a single conditional statement, so two clicks racing each
+    other can never both act on the same stale read, and the counters move
+    in the same transaction as the Vote row.
+    """
+    target = "thread" if isinstance(obj, Thread) else "reply"
+    votes = Vote.objects.filter(user=user, **{target: obj})
+
+    for attempt in range(1, INSERT_ATTEMPTS + 1):
+        with transaction.atomic():
+            # same direction again: take the vote back
+            deleted, _ = votes.filter(value=value).delete()
+            if deleted:
+                apply_vote_delta(type(obj), obj.id, value, 0)
+                return 0
+
+            # opposite direction: flip it
+            if votes.exclude(value=value).update(value=value):
+                apply_vote_delta(type(obj), obj.id, -value, value)
+                return value
+
+            try:
+                with transaction.atomic():
+                    Vote.objects.create(user=user, value=value, **{target: obj})
+            except IntegrityError:
+                # a concurrent click inserted first; go again and act on it
+                if attempt == INSERT_ATTEMPTS:
+                    raise
+                continue
+
+            apply_vote_delta(type(obj), obj.id, 0, value)
+            return value
@@ -50,7 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # timing, query counts and Server-Timing; first so it sees everything
+    'forum.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # compresses dynamic HTML; before anything that reads the body. API
+    # responses stay uncompressed to keep their strong ETags
+    'forum.middleware.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -65,7 +70,8 @@ ROOT_URLCONF = 'impartus_app.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to PerformanceMiddleware
+        'BACKEND': 'forum.performance.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'forum.context_processors.notifications',
             ],
         },
     },
@@ -88,9 +95,79 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # wait up to 20s for the write lock instead of failing at once
+            'timeout': 20,
+            # take the write lock when the transaction starts, so two
+            # read-then-write transactions can't deadlock on the upgrade
+            'transaction_mode': 'IMMEDIATE',
+            # readers don't block the writer (and vice versa) in WAL mode
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA busy_timeout=20000;'
+            ),
+        },
+    }
+}
+
+
+# Cache
+# Rendered thread cards and reply blocks are cached here (see forum/caching.py).
+# LocMemCache is per-process; with several workers use a shared backend, e.g.
+#   "BACKEND": "forum.metrics.CountingFileBasedCache",
+#   "LOCATION": BASE_DIR / "cache",
+# or
+#   "BACKEND": "forum.metrics.CountingRedisCache",
+#   "LOCATION": "redis://127.0.0.1:6379",
+# The forum.metrics backends are Django's own plus hit/miss counts on /metrics.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'forum.metrics.CountingLocMemCache',
+        'LOCATION': 'studydeck',
     }
 }
 
+FORUM_CACHE_ALIAS = 'default'
+FORUM_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Mixed into the ETags of HTML pages; change it on deploy so browsers don't
+# keep pages rendered by the previous templates.
+FORUM_ETAG_SALT = ''
+
+# Live thread updates (server-sent events). Turn on only when served by an
+# ASGI server (daphne, uvicorn); under WSGI the stream answers 204.
+# The default broker only reaches streams in the same process; with several
+# workers set FORUM_LIVE_BROKER to a broker class that relays between them.
+# FORUM_LIVE_BROKER = 'myproject.brokers.RedisBroker'
+FORUM_LIVE_UPDATES = False
+FORUM_LIVE_HEARTBEAT = 20
+FORUM_LIVE_MAX_CONNECTIONS = 1000
+FORUM_LIVE_MAX_CONNECTIONS_PER_USER = 4
+
+# Requests running more queries than this are logged as warnings by
+# forum.middleware.PerformanceMiddleware. Its Server-Timing header can be
+# turned off with FORUM_SERVER_TIMING = False.
+FORUM_QUERY_BUDGET = 25
+
+# Prometheus metrics at /metrics. With several worker processes point
+# FORUM_METRICS_DIR at a directory they share, emptied on each deploy, or
+# every scrape only sees the process that answered it. Scrapers send
+# "Authorization: Bearer <FORUM_METRICS_TOKEN>"; None leaves it open.
+FORUM_METRICS_DIR = None
+FORUM_METRICS_TOKEN = None
+
+# Token buckets for posting, voting and reporting, "burst/period" per action
+# ("3/10m": 3 at once, then one more every 200 seconds). Group entries
+# replace the defaults for members; None means unlimited. The buckets live
+# in the cache above, so with several processes it has to be a shared one
+# (Redis, Memcached) or each process enforces its own limits.
+FORUM_RATE_LIMITS = {
+    'default': {'thread': '3/10m', 'reply': '10/m', 'vote': '60/m', 'report': '10/h'},
+    'Moderators': {'thread': None, 'reply': None, 'vote': None, 'report': None},
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -128,11 +205,30 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Hashed names + precompressed .gz/.br copies (brotli copies need the
+# optional Brotli package). Serve STATIC_ROOT straight from the web server
+# with far-future caching, e.g. for nginx:
+#
+#   location /static/ {
+#       gzip_static on;
+#       brotli_static on;
+#       add_header Cache-Control "public, max-age=31536000, immutable";
+#   }
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "forum.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+
 
 SITE_ID = 1
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    # ModelBackend with cached permission/group lookups
+    'forum.permissions.CachedModelBackend',
     'allauth.account.auth_backends.AuthenticationBackend',
 ]
 
@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.shortcuts import redirect
 
+from forum.views import prometheus_metrics
+
 
 def root_view(request):
     if request.user.is_authenticated:
@@ -29,7 +31,11 @@ urlpatterns = [
     path("", root_view),
 
     path("threads/", include("forum.urls")),      # forum pages
+    path("courses/", include("forum.course_urls")),  # course catalog
+    path("notifications/", include("forum.notification_urls")),
     path("moderation/", include("forum.mod_urls")),  # moderation ONLY
+    path("api/", include("forum.api_urls")),  # read-only JSON
+    path("metrics", prometheus_metrics, name="metrics"),  # Prometheus scrapes
 
     path("admin/", admin.site.urls),
     path("accounts/", include("allauth.urls")),